@@ -1,10 +1,14 @@
 import os
 import json
+import hashlib
+import tempfile
+import numpy as np
 import pandas as pd
 
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
-
-DATAHAIRCUT = pd.read_excel(".ignore/tradinglimitdata.xlsx", sheet_name="Haircut")
+# Data lives next to this file; nothing is read until the first limit is requested
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+DATAPATH = os.path.join(FOLDER, ".ignore", "tradinglimitdata.xlsx")
+SNAPSHOTPATH = os.path.join(FOLDER, ".ignore", "tradinglimitdata.npz")
 
 CLASS = {
     "A": [0, 25],
@@ -154,26 +158,340 @@ HYPARAM = {
     },
 }
 
+# Compiled CLASS and HYPARAM, indexed by class id and account id in the engines
+CLASSLABEL = np.array(list(CLASS))
+CLASSLOW = np.array([low for low, high in CLASS.values()]) / 100
+CLASSHIGH = np.array([high for low, high in CLASS.values()]) / 100
+ACCOUNT = list(HYPARAM)
+ACCOUNTID = {account: index for index, account in enumerate(ACCOUNT)}
+PARAMETER = ["MULTIPLIERSTOCK", "CAPPING", "EFFECTIVEBUYRATE", "MULTIPLIERCASH"]
+MS, CAP, EBR, MC = range(len(PARAMETER))
+
+def classify(haircut):
+    """Class id of any number of haircuts, -1 where a haircut falls between CLASS ranges"""
+    haircut = np.asarray(haircut, dtype=np.float64)
+    classid = np.searchsorted(CLASSLOW, haircut, side="right") - 1
+    return np.where((classid >= 0) & (haircut <= CLASSHIGH[classid]), classid, -1).astype(np.int8)
+
+def compileparam(hyparam=HYPARAM):
+    """HYPARAM as a dense [account, parameter, class] array, with CAPPING in rupiah"""
+    param = np.array([
+        [[hyparam[account][name][label] for label in CLASS] for name in PARAMETER]
+        for account in ACCOUNT
+    ], dtype=np.float64)
+    param[:, CAP] *= 1000000000
+    return param
+
+PARAM = compileparam()
+
+# Fixed-point multipliers for the exact engine: MULTIPLIERSTOCK, EFFECTIVEBUYRATE and
+# MULTIPLIERCASH are stored times SCALE, CAPPING in whole rupiah
+SCALE = 100
+
+def compileparamint(hyparam=HYPARAM):
+    """compileparam() as int64 fixed point, refusing values that SCALE cannot hold exactly"""
+    param = compileparam(hyparam)
+    scale = np.ones(len(PARAMETER))
+    scale[[MS, EBR, MC]] = SCALE
+    scaled = param * scale[:, None]
+    if not np.allclose(scaled, np.rint(scaled), rtol=0, atol=1e-6):
+        raise ValueError(f"HYPARAM has multipliers finer than 1/{SCALE}")
+    return np.rint(scaled).astype(np.int64)
+
+PARAMINT = compileparamint()
+
+def lookupstock(index, stock_code):
+    """Position of a code, or of every code in an array, in a pd.Index of codes"""
+    if isinstance(stock_code, (int, np.integer)):
+        if not 0 <= stock_code < len(index):
+            raise KeyError(f"Unknown stock id {stock_code}: not in the haircut table")
+        return int(stock_code)
+    if np.ndim(stock_code) == 0:
+        try:
+            return index.get_loc(stock_code)
+        except KeyError:
+            raise KeyError(f"Unknown stock code {stock_code!r}: not in the haircut table") from None
+    stock_code = np.asarray(stock_code)
+    if stock_code.dtype.kind in "iu":
+        outside = (stock_code < 0) | (stock_code >= len(index))
+        if outside.any():
+            unknown = ", ".join(str(code) for code in pd.unique(stock_code[outside].ravel())[:10])
+            raise KeyError(f"Unknown stock id(s) {unknown}: not in the haircut table")
+        return stock_code.astype(np.intp)
+    ids = index.get_indexer(stock_code).astype(np.intp)
+    if (ids < 0).any():
+        unknown = ", ".join(str(code) for code in pd.unique(stock_code[ids < 0])[:10])
+        raise KeyError(f"Unknown stock code(s) {unknown}: not in the haircut table")
+    return ids
+
+class HaircutTable:
+    """Haircut and class of every stock code, indexed by integer stock id"""
+    def __init__(self, code, haircut):
+        code = np.asarray(code, dtype=str)
+        haircut = np.asarray(haircut, dtype=np.float64)
+        # A code listed twice keeps its first haircut, as the DataFrame lookup did
+        first = ~pd.Index(code).duplicated(keep="first")
+        self.code = code[first]
+        self.haircut = haircut[first]
+        self.index = pd.Index(self.code)
+        self.classid = classify(self.haircut)
+
+    @classmethod
+    def fromarrays(cls, code, haircut, classid):
+        """Table over arrays that are already deduplicated and classified, without copying them"""
+        table = cls.__new__(cls)
+        table.code = code
+        table.haircut = haircut
+        table.classid = classid
+        table.index = pd.Index(code)
+        return table
+
+    def __len__(self):
+        return len(self.code)
+
+    def stockid(self, stock_code):
+        """Integer id of a code, or of every code in an array; integer ids pass through"""
+        return lookupstock(self.index, stock_code)
+
+    def classof(self, stock_id):
+        """Class id of the given stock ids, refusing haircuts that fall between CLASS ranges"""
+        classid = self.classid[stock_id]
+        if np.any(classid < 0):
+            missing = ", ".join(str(code) for code in pd.unique(np.atleast_1d(self.code[stock_id])[np.atleast_1d(classid) < 0])[:10])
+            raise ValueError(f"Haircut of {missing} is outside every CLASS range")
+        return classid
+
+def filehash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def savesnapshot(snapshot, code, haircut, stat, digest):
+    # Best effort: a private temporary file per writer, so concurrent rebuilds each replace
+    # the snapshot whole, and a folder that cannot be written only costs the cache
+    temp = None
+    try:
+        handle, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(snapshot)), suffix=".tmp")
+        with os.fdopen(handle, "wb") as f:
+            np.savez(f, code=np.asarray(code, dtype=str), haircut=np.asarray(haircut, dtype=np.float64),
+                mtime=stat.st_mtime_ns, size=stat.st_size, hash=digest)
+        os.replace(temp, snapshot)
+    except OSError:
+        if temp is not None and os.path.exists(temp):
+            os.remove(temp)
+
+def loadhaircut(path=DATAPATH, snapshot=SNAPSHOTPATH):
+    """Haircut table of the workbook at path, cached as an NPZ snapshot stamped with its mtime, size and sha256"""
+    stat = os.stat(path)
+    digest = None
+    try:
+        with np.load(snapshot, allow_pickle=False) as data:
+            cached = {name: data[name] for name in ("code", "haircut", "mtime", "size", "hash")}
+    except (OSError, KeyError, ValueError):
+        cached = None
+    if cached is not None:
+        if cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            return HaircutTable(cached["code"], cached["haircut"] / 100)
+        digest = filehash(path)
+        if str(cached["hash"]) == digest:
+            savesnapshot(snapshot, cached["code"], cached["haircut"], stat, digest)
+            return HaircutTable(cached["code"], cached["haircut"] / 100)
+
+    data = pd.read_excel(path, sheet_name="Haircut")
+    savesnapshot(snapshot, data["Kode"].astype(str), data["Haircut"], stat, digest or filehash(path))
+    return HaircutTable(data["Kode"].astype(str), data["Haircut"] / 100)
+
+_HAIRCUTTABLE = None
+
+def gethaircuttable():
+    """Haircut table of DATAPATH, loaded on first use"""
+    global _HAIRCUTTABLE
+    if _HAIRCUTTABLE is None:
+        _HAIRCUTTABLE = loadhaircut()
+    return _HAIRCUTTABLE
+
+def usehaircuttable(table):
+    """Install table as the one every engine uses by default, e.g. one attached from shared memory"""
+    global _HAIRCUTTABLE
+    _HAIRCUTTABLE = table
+
+def __getattr__(name):
+    # Keeps tl.DATAHAIRCUT (Kode, Haircut in percent) and tl.HAIRCUTTABLE working without
+    # loading at import
+    if name == "DATAHAIRCUT":
+        table = gethaircuttable()
+        return pd.DataFrame({"Kode": table.code, "Haircut": table.haircut * 100})
+    if name == "HAIRCUTTABLE":
+        return gethaircuttable()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def gethaircut(stock_code):
-    haircut = DATAHAIRCUT.loc[DATAHAIRCUT["Kode"] == stock_code, "Haircut"].values[0] / 100
+    table = gethaircuttable()
+    haircut = table.haircut[table.stockid(stock_code)]
     return haircut
 
 def getclass(stock_code):
-    haircut = gethaircut(stock_code)
-    for label, [low, high] in CLASS.items():
-        if low / 100 <= haircut <= high / 100:
-            return label
+    table = gethaircuttable()
+    classid = table.classid[table.stockid(stock_code)]
+    if classid >= 0:
+        return str(CLASSLABEL[classid])
 
 def tradinglimit(account="FREE", stock_buy="BBCA", portofolio=""):
-    stock_class = getclass(stock_buy)
+    table = gethaircuttable()
+    param = PARAM[ACCOUNTID[account]]
+    stock_class = table.classof(table.stockid(stock_buy))
     tl = 0
     for stock_code, stock_info in portofolio.items():
         if stock_code=="CASHT2":
-            tl += HYPARAM[account]["MULTIPLIERCASH"][stock_class] * portofolio["CASHT2"]
+            tl += param[MC, stock_class] * portofolio["CASHT2"]
         else:
-            temp_class = getclass(stock_code)
-            tl += HYPARAM[account]["MULTIPLIERSTOCK"][temp_class] * \
-                min(stock_info["lot"] * 100 * stock_info["price"] * (1 - gethaircut(stock_code)), \
-                HYPARAM[account]["CAPPING"][temp_class] * 1000000000)
-    tl *= HYPARAM[account]["EFFECTIVEBUYRATE"][stock_class]
-    return tl
\ No newline at end of file
+            stock_id = table.stockid(stock_code)
+            temp_class = table.classof(stock_id)
+            tl += param[MS, temp_class] * \
+                min(stock_info["lot"] * 100 * stock_info["price"] * (1 - table.haircut[stock_id]), \
+                param[CAP, temp_class])
+    tl *= param[EBR, stock_class]
+    return tl
+
+# Batch engines. A book is struct-of-arrays: one row per holding in client, stock_code,
+# lot and price, client being the position of the holding's owner in cash. stock_code
+# and stock_buy take codes or integer stock ids, stock_buy one for the book or per client.
+# With X the class of stock_buy:
+#     TL = EBR_X * (MC_X * cash + sum_k MS_k * min(lot_k * 100 * price_k * (1 - h_k), CAP_k))
+# Below its CAPPING a holding has dTL/dprice = EBR_X * MS_k * (1 - h_k) * lot_k * 100 and
+# dTL/dhaircut = -EBR_X * MS_k * lot_k * 100 * price_k, both zero once it is capped.
+# tradinglimitexact rounds holdings to whole shares (lot * 100), price and cash to rupiah
+# and haircuts to basis points, the collateral half up, sums exactly in SCALE units and
+# divides back half up. It is a reproducible model rather than the broker's arithmetic:
+# recorded broker inputs are float32 screen values, so broker figures can differ by
+# about one float32 step.
+def tradinglimitbatch(account="FREE", stock_buy="BBCA", client=(), stock_code=(), lot=(), price=(), cash=(), table=None, param=None):
+    """Trading limit of every client of a book, aligned with cash"""
+    table = gethaircuttable() if table is None else table
+    param = (PARAM if param is None else param)[ACCOUNTID[account]]
+    stock_id = table.stockid(np.asarray(stock_code))
+    collateral, _ = collateralcore(param, table.haircut[stock_id], table.classof(stock_id), lot, price)
+    return tradinglimitcore(param, client, collateral, cash, table.classof(table.stockid(stock_buy)))
+
+def collateralcore(param, haircut, stock_class, lot, price):
+    """MS * min(lot * 100 * price * (1 - haircut), CAP) of every holding, and whether it is below CAP"""
+    lot = np.asarray(lot, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    value = lot * 100 * price * (1 - haircut)
+    capping = param[CAP, stock_class]
+    return param[MS, stock_class] * np.minimum(value, capping), value < capping
+
+def tradinglimitcore(param, client, collateral, cash, buy_class):
+    """The limit formula on collateralcore() contributions, buy class per client"""
+    cash = np.asarray(cash, dtype=np.float64)
+    client = np.asarray(client, dtype=np.intp)
+    tl = param[MC, buy_class] * cash + np.bincount(client, weights=collateral, minlength=len(cash))
+    tl *= param[EBR, buy_class]
+    return tl
+
+def tradinglimitsensitivity(account="FREE", stock_buy="BBCA", client=(), stock_code=(), lot=(), price=(), cash=(), table=None, param=None):
+    """tradinglimitbatch plus dTL/dprice and dTL/dhaircut of every holding"""
+    table = gethaircuttable() if table is None else table
+    param = (PARAM if param is None else param)[ACCOUNTID[account]]
+    stock_id = table.stockid(np.asarray(stock_code))
+    stock_class = table.classof(stock_id)
+    haircut = table.haircut[stock_id]
+    client = np.asarray(client, dtype=np.intp)
+    lot = np.asarray(lot, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    buy_class = np.broadcast_to(table.classof(table.stockid(stock_buy)), np.shape(cash))
+
+    collateral, below = collateralcore(param, haircut, stock_class, lot, price)
+    tl = tradinglimitcore(param, client, collateral, cash, buy_class)
+    slope = param[EBR, buy_class][client] * param[MS, stock_class] * below
+    return tl, slope * (1 - haircut) * lot * 100, -slope * (lot * 100 * price)
+
+def tradinglimitexact(account="FREE", stock_buy="BBCA", client=(), stock_code=(), lot=(), price=(), cash=(), table=None, param=None):
+    """tradinglimitbatch in int64 fixed point, deterministic to the rupiah"""
+    table = gethaircuttable() if table is None else table
+    param = (PARAMINT if param is None else param)[ACCOUNTID[account]]
+    cash = np.rint(np.asarray(cash, dtype=np.float64)).astype(np.int64)
+    client = np.asarray(client, dtype=np.intp)
+    shares = np.rint(np.asarray(lot, dtype=np.float64) * 100).astype(np.int64)
+    price = np.rint(np.asarray(price, dtype=np.float64)).astype(np.int64)
+    stock_id = table.stockid(np.asarray(stock_code))
+    stock_class = table.classof(stock_id)
+    buy_class = table.classof(table.stockid(stock_buy))
+
+    haircut = np.rint(table.haircut[stock_id] * 10000).astype(np.int64)
+    if np.any(np.abs(shares.astype(np.float64) * price * (10000 - haircut)) >= np.iinfo(np.int64).max):
+        raise OverflowError("Holding value too large for the int64 fixed-point engine")
+    collateral = divhalfup(shares * price * (10000 - haircut), 10000)
+    collateral = param[MS, stock_class] * np.minimum(collateral, param[CAP, stock_class])
+    base = param[MC, buy_class] * cash + groupsumint(client, collateral, len(cash))
+    if np.any(np.abs(base) > np.iinfo(np.int64).max // SCALE):
+        raise OverflowError("Trading limit too large for the int64 fixed-point engine")
+    return divhalfup(base * param[EBR, buy_class], SCALE * SCALE)
+
+def divhalfup(numerator, denominator):
+    return (numerator + denominator // 2) // denominator
+
+def groupsumint(client, values, n):
+    """Exact int64 sum of values per client, in 26-bit halves that bincount sums exactly"""
+    low = np.bincount(client, weights=values & (2**26 - 1), minlength=n).astype(np.int64)
+    high = np.bincount(client, weights=values >> 26, minlength=n).astype(np.int64)
+    return (high << 26) + low
+
+def brokerdisplay(tl):
+    """Limits rounded through float32, the display precision of the broker screen"""
+    return np.asarray(tl).astype(np.float32).astype(np.int64)
+
+def tradinglimittensor(stock_buy="BBCA", client=(), stock_code=(), lot=(), price=(), cash=(), table=None, param=None):
+    """Trading limit of a whole book under every account type, as an [account, client] array"""
+    table = gethaircuttable() if table is None else table
+    param = PARAM if param is None else param
+    cash = np.asarray(cash, dtype=np.float64)
+    client = np.asarray(client, dtype=np.intp)
+    stock_id = table.stockid(np.asarray(stock_code))
+    stock_class = table.classof(stock_id)
+    buy_class = np.broadcast_to(table.classof(table.stockid(stock_buy)), cash.shape)
+    value = np.asarray(lot, dtype=np.float64) * 100 * np.asarray(price, dtype=np.float64) * (1 - table.haircut[stock_id])
+
+    naccount, nclient = len(param), len(cash)
+    collateral = param[:, MS, stock_class] * np.minimum(value, param[:, CAP, stock_class])
+    key = (np.arange(naccount)[:, None] * nclient + client).ravel()
+    tl = param[:, MC, buy_class] * cash + \
+        np.bincount(key, weights=collateral.ravel(), minlength=naccount * nclient).reshape(naccount, nclient)
+    tl *= param[:, EBR, buy_class]
+    return tl
+
+def flattenportofolio(portofolios):
+    """Portofolio dicts keyed by client as clients, client, stock_code, lot, price and cash"""
+    clients = list(portofolios)
+    client, stock_code, lot, price = [], [], [], []
+    cash = np.zeros(len(clients), dtype=np.float64)
+    for index, portofolio in enumerate(portofolios.values()):
+        for code, info in portofolio.items():
+            if code == "CASHT2":
+                cash[index] = float(info)
+            else:
+                client.append(index)
+                stock_code.append(code)
+                lot.append(info["lot"])
+                price.append(info["price"])
+    return (clients, np.array(client, dtype=np.intp), np.array(stock_code, dtype=str),
+        np.array(lot, dtype=np.float64), np.array(price, dtype=np.float64), cash)
+
+def tradinglimitall(account="FREE", portofolio="", table=None, param=None):
+    """Trading limit of one portofolio for every stock of the table, as a Series by code"""
+    table = gethaircuttable() if table is None else table
+    param = (PARAM if param is None else param)[ACCOUNTID[account]]
+    holdings = [(stock_code, stock_info) for stock_code, stock_info in portofolio.items() if stock_code != "CASHT2"]
+    stock_id = table.stockid(np.array([stock_code for stock_code, _ in holdings], dtype=str))
+    stock_class = table.classof(stock_id)
+    lot = np.array([stock_info["lot"] for _, stock_info in holdings], dtype=np.float64)
+    price = np.array([stock_info["price"] for _, stock_info in holdings], dtype=np.float64)
+    collateral = np.sum(param[MS, stock_class] * \
+        np.minimum(lot * 100 * price * (1 - table.haircut[stock_id]), param[CAP, stock_class]))
+    return broadcastclass(table, param[EBR] * (param[MC] * portofolio.get("CASHT2", 0) + collateral), name=account)
+
+def broadcastclass(table, byclass, name=None):
+    """Spread one value per class over every stock of the table"""
+    return pd.Series(np.where(table.classid >= 0, byclass[table.classid], np.nan), index=table.code, name=name)
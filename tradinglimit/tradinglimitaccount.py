@@ -0,0 +1,80 @@
+import math
+import tradinglimit as tl
+
+class Account:
+    """Trading limit state of one client, kept up to date holding by holding.
+
+    Every holding stores its collateral contribution
+    MULTIPLIERSTOCK * min(lot * 100 * price * (1 - haircut), CAPPING), and the account
+    keeps their running total, so a fill, a price tick or a cash movement costs O(1)
+    and so does the limit for any candidate stock.
+    """
+    def __init__(self, account="FREE", portofolio=None, table=None, param=None):
+        self.account = account
+        self.table = tl.gethaircuttable() if table is None else table
+        self.param = (tl.PARAM if param is None else param)[tl.ACCOUNTID[account]]
+        self.cash = 0.0
+        self.collateral = 0.0
+        self.holdings = {}  # stock_id: [lot, price, contribution]
+        for stock_code, stock_info in (portofolio or {}).items():
+            if stock_code == "CASHT2":
+                self.cash = float(stock_info)
+            else:
+                self.setholding(stock_code, stock_info["lot"], stock_info["price"])
+
+    def contribution(self, stock_id, lot, price):
+        stock_class = self.table.classof(stock_id)
+        return self.param[tl.MS, stock_class] * \
+            min(lot * 100 * price * (1 - self.table.haircut[stock_id]), self.param[tl.CAP, stock_class])
+
+    def setholding(self, stock_code, lot, price):
+        """Replace the position in one stock; lot 0 removes it"""
+        stock_id = self.table.stockid(stock_code)
+        old = self.holdings.pop(stock_id, None)
+        if old is not None:
+            self.collateral -= old[2]
+        if lot:
+            new = self.contribution(stock_id, lot, price)
+            self.holdings[stock_id] = [lot, price, new]
+            self.collateral += new
+
+    def fill(self, stock_code, lot, price, fee=0.0):
+        """Apply an executed trade: positive lot buys, negative lot sells, cash settles at price"""
+        stock_id = self.table.stockid(stock_code)
+        held = self.holdings.get(stock_id, [0, price, 0.0])[0]
+        if held + lot < 0:
+            raise ValueError(f"Cannot sell {-lot} lots of {self.table.code[stock_id]}: only {held} held")
+        self.setholding(stock_id, held + lot, price)
+        self.cash -= lot * 100 * price + fee
+
+    def tick(self, stock_code, price):
+        """Revalue a held stock at a new price; stocks not held are ignored"""
+        stock_id = self.table.stockid(stock_code)
+        if stock_id in self.holdings:
+            self.setholding(stock_id, self.holdings[stock_id][0], price)
+
+    def movecash(self, amount):
+        """Deposit (positive) or withdraw (negative) cash"""
+        self.cash += amount
+
+    def resync(self):
+        """Re-sum the contributions exactly, dropping drift from many small updates"""
+        self.collateral = math.fsum(holding[2] for holding in self.holdings.values())
+        return self.collateral
+
+    def tradinglimit(self, stock_buy="BBCA"):
+        stock_class = self.table.classof(self.table.stockid(stock_buy))
+        return self.param[tl.EBR, stock_class] * \
+            (self.param[tl.MC, stock_class] * self.cash + self.collateral)
+
+    def tradinglimitall(self):
+        """Limit for every stock of the haircut table, as a Series indexed by code"""
+        byclass = self.param[tl.EBR] * (self.param[tl.MC] * self.cash + self.collateral)
+        return tl.broadcastclass(self.table, byclass, name=self.account)
+
+    def portofolio(self):
+        """The state back in the nested dict format of tl.tradinglimit()"""
+        portofolio = {"CASHT2": self.cash}
+        for stock_id, [lot, price, _] in self.holdings.items():
+            portofolio[str(self.table.code[stock_id])] = {"lot": lot, "price": price}
+        return portofolio
@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import importlib
+import numpy as np
+import pandas as pd
+import tradinglimit as tl
+import tradinglimitbook as tb
+from tradinglimithistory import HaircutHistory, asofjoin, tradinglimitasof
+from tradinglimiteod import ResultWriter
+
+def readframe(path, columns, dtype=None):
+    """columns of a .csv or .parquet (needs pyarrow) file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return pd.read_csv(path, usecols=columns, dtype=dtype)
+    if extension == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+    raise ValueError(f"Unknown file format {extension!r}: expected .parquet or .csv")
+
+class PositionHistory:
+    """Client books by date: a client's book on a day is its latest snapshot on or before it.
+
+    Snapshots are rows of date plus the book columns (client, code, lot, price), with cash
+    on CASHT2 rows; a client needs a new snapshot only when its book changes, though daily
+    dumps work as well. Holdings are kept sorted by snapshot, with start and count per
+    snapshot, and codes are stock ids of index.
+    """
+    def __init__(self, date, client, code, lot, price, index):
+        date = np.asarray(date, dtype="datetime64[D]")
+        client, self.clients = pd.factorize(np.asarray(client, dtype=str))
+        order = np.lexsort((date, client))
+        date, client = date[order], client[order]
+        code = np.asarray(code, dtype=str)[order]
+        lot = np.asarray(lot, dtype=np.float64)[order]
+        price = np.asarray(price, dtype=np.float64)[order]
+
+        new = np.ones(len(date), dtype=bool)
+        new[1:] = (client[1:] != client[:-1]) | (date[1:] != date[:-1])
+        snapshot = np.cumsum(new) - 1
+        self.date = date[new]
+        self.client = client[new].astype(np.intp)
+        iscash = code == "CASHT2"
+        self.cash = np.bincount(snapshot[iscash], weights=price[iscash], minlength=len(self.date))
+        held = ~iscash
+        self.stock_id = tl.lookupstock(index, code[held])
+        self.lot = lot[held]
+        self.count = np.bincount(snapshot[held], minlength=len(self.date))
+        self.start = np.cumsum(self.count) - self.count
+
+    @classmethod
+    def fromfile(cls, path, index):
+        """PositionHistory of a .csv or .parquet file with columns date, client, code, lot, price"""
+        frame = readframe(path, ["date"] + tb.COLUMNS, dict(tb.BOOKDTYPE, date=str))
+        return cls(pd.to_datetime(frame["date"]).to_numpy(), frame["client"].to_numpy(), frame["code"].to_numpy(),
+            frame["lot"].to_numpy(), frame["price"].to_numpy(), index)
+
+    def asof(self, days):
+        """Snapshot in force for every client with a book on each of days: day position, client, snapshot"""
+        nclient = len(self.clients)
+        day = np.repeat(np.arange(len(days)), nclient)
+        client = np.tile(np.arange(nclient), len(days))
+        snapshot = asofjoin(client, days[day], self.client, self.date)
+        live = snapshot >= 0
+        return day[live], client[live], snapshot[live]
+
+    def holdings(self, snapshot):
+        """Holdings of each snapshot: position in snapshot, stock id and lot"""
+        count = self.count[snapshot]
+        owner = np.repeat(np.arange(len(snapshot)), count)
+        rank = np.arange(len(owner)) - np.repeat(np.cumsum(count) - count, count)
+        row = self.start[snapshot][owner] + rank
+        return owner, self.stock_id[row], self.lot[row]
+
+def backfillchunk(history, positions, days, account=("FREE",), stock_buy=("BBCA",), close_id=(), close_date=(), close=()):
+    """Limits of every client with a book on each of days, in one pass per account and stock_buy.
+
+    Books, closes and haircuts are all joined as of each day. Returns a DataFrame with
+    date, client, account and a limit_<code> column per stock_buy.
+    """
+    days = np.asarray(days, dtype="datetime64[D]")
+    day, client, snapshot = positions.asof(days)
+    owner, stock_id, lot = positions.holdings(snapshot)
+    date = days[day]
+    row = asofjoin(stock_id, date[owner], close_id, close_date)
+    if np.any(row < 0):
+        first = np.flatnonzero(row < 0)[0]
+        raise ValueError(f"No close of {history.code[stock_id[first]]} on or before {date[owner[first]]}")
+    price = np.asarray(close, dtype=np.float64)[row]
+    cash = positions.cash[snapshot]
+
+    frames = []
+    for name in account:
+        result = pd.DataFrame({"date": date, "client": np.asarray(positions.clients)[client], "account": name})
+        for code in stock_buy:
+            result[f"limit_{code}"] = tradinglimitasof(history, name, code, date, owner, stock_id, lot, price, cash)
+        frames.append(result)
+    return pd.concat(frames, ignore_index=True)
+
+def writepartitions(frame, output, part, extension):
+    """Write frame into a dataset partitioned by month, output/month=YYYY-MM/part<part><extension>"""
+    month = frame["date"].dt.strftime("%Y-%m")
+    for value, partition in frame.groupby(month):
+        folder = os.path.join(output, f"month={value}")
+        os.makedirs(folder, exist_ok=True)
+        writer = ResultWriter(os.path.join(folder, f"part{part:05d}{extension}"))
+        try:
+            writer.write(partition)
+        finally:
+            writer.close()
+
+def backfilljob(positions, closes, output, reports=None, start=None, end=None, account=("FREE",), stock_buy=("BBCA",),
+        chunkdays=20, extension=".csv"):
+    """Trading limit of every client on every trading day, written as a dataset partitioned by month.
+
+    positions and closes are .csv or .parquet files (date, client, code, lot, price and
+    date, code, close); reports are HCPROFINDO paths, by default every one in .ignore.
+    Trading days are the close dates between start and end, evaluated chunkdays at a
+    time with vectorized as-of joins, so memory follows the chunk and not the range.
+    extension is .csv or .parquet (needs pyarrow). The dataset is built in a staging
+    folder next to output and only replaces output once every chunk is written, so a
+    failed run leaves no partial dataset. Returns the number of rows written.
+    """
+    if extension == ".parquet":
+        # Fail before any compute rather than at the first partition
+        importlib.import_module("pyarrow.parquet")
+    start_time = time.perf_counter()
+    history = HaircutHistory.fromreports(reports)
+    book = PositionHistory.fromfile(positions, history.index)
+    frame = readframe(closes, ["date", "code", "close"], {"date": str, "code": str, "close": np.float64})
+    close_id = history.index.get_indexer(frame["code"].to_numpy(dtype=str))
+    # Closes of stocks that never appear in a haircut report cannot be held as collateral
+    known = close_id >= 0
+    close_id = close_id[known]
+    close_date = pd.to_datetime(frame["date"]).to_numpy()[known].astype("datetime64[D]")
+    close = frame["close"].to_numpy()[known]
+
+    days = np.unique(close_date)
+    if start is not None:
+        days = days[days >= np.datetime64(start, "D")]
+    if end is not None:
+        days = days[days <= np.datetime64(end, "D")]
+    print(f"{len(book.clients):,} clients, {len(book.date):,} snapshots, {len(days):,} days, "
+        f"loaded in {time.perf_counter() - start_time:.2f} s", file=sys.stderr)
+
+    nrow = 0
+    output = os.path.abspath(output)
+    staging = tempfile.mkdtemp(dir=os.path.dirname(output), prefix=f".{os.path.basename(output)}.")
+    try:
+        for part, first in enumerate(range(0, len(days), chunkdays)):
+            chunk = time.perf_counter()
+            result = backfillchunk(history, book, days[first:first + chunkdays], account, stock_buy, close_id, close_date, close)
+            writepartitions(result, staging, part, extension)
+            nrow += len(result)
+            print(f"{days[first]} .. {days[min(first + chunkdays, len(days)) - 1]} {len(result):>12,} rows"
+                f" {time.perf_counter() - chunk:8.2f} s", file=sys.stderr)
+        if os.path.exists(output):
+            shutil.rmtree(output)
+        os.replace(staging, output)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    print(f"total {time.perf_counter() - start_time:.2f} s", file=sys.stderr)
+    return nrow
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill daily trading limits over position, close and haircut history")
+    parser.add_argument("positions", help=".csv or .parquet with date, client, code, lot, price; CASHT2 rows carry cash in price")
+    parser.add_argument("closes", help=".csv or .parquet with date, code, close")
+    parser.add_argument("output", help="dataset folder, partitioned by month; replaced when the run completes")
+    parser.add_argument("--reports", nargs="+", default=None, help="HCPROFINDO reports; every one in .ignore by default")
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--account", nargs="+", default=["FREE"], choices=tl.ACCOUNT)
+    parser.add_argument("--stock-buy", nargs="+", default=["BBCA"])
+    parser.add_argument("--chunk-days", type=int, default=20)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="parquet needs pyarrow")
+    args = parser.parse_args()
+    backfilljob(args.positions, args.closes, args.output, args.reports, args.start, args.end, args.account,
+        args.stock_buy, args.chunk_days, "." + args.format)
@@ -0,0 +1,112 @@
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import tradinglimit as tl
+from tradinglimitaccount import Account
+
+def syntheticbook(nclient, maxholding=50, seed=0, table=None):
+    """Random book of nclient clients with 1 to maxholding distinct stocks each, drawn from the haircut table.
+
+    Returns client, stock_id, lot, price and cash as the batch engines take them.
+    """
+    table = tl.gethaircuttable() if table is None else table
+    rng = np.random.default_rng(seed)
+    count = rng.integers(1, maxholding + 1, nclient)
+    client = np.repeat(np.arange(nclient), count)
+    # Distinct stocks per client: consecutive stock ids from a random offset
+    offset = np.repeat(rng.integers(0, len(table), nclient), count)
+    rank = np.arange(len(client)) - np.repeat(np.cumsum(count) - count, count)
+    stock_id = (offset + rank) % len(table)
+    lot = rng.integers(1, 50000, len(client)).astype(np.float64)
+    price = rng.integers(50, 20000, len(client)).astype(np.float64)
+    cash = rng.integers(0, 10**11, nclient).astype(np.float64)
+    return client, stock_id, lot, price, cash
+
+def timeit(function, repeat):
+    """Seconds of every one of repeat calls"""
+    seconds = np.empty(repeat)
+    for index in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds[index] = time.perf_counter() - start
+    return seconds
+
+def report(results, name, seconds, items):
+    p50, p99 = np.percentile(seconds, [50, 99]) * 1000
+    print(f"{name:<36}{items / np.median(seconds):>16,.0f}/s{p50:>12.3f} ms{p99:>12.3f} ms")
+    results[name] = {"throughput": items / np.median(seconds), "p50": p50, "p99": p99}
+
+def benchmark(sizes=(1, 100, 10000, 100000), maxholding=50, account="FREE", repeat=20, seed=0):
+    """Print and return throughput and p50/p99 latency (ms) of every engine and book size"""
+    results = {}
+    table = tl.gethaircuttable()
+    rng = np.random.default_rng(seed)
+    print(f"{'case':<36}{'throughput':>18}{'p50':>15}{'p99':>15}")
+    for nclient in sizes:
+        client, stock_id, lot, price, cash = syntheticbook(nclient, maxholding, seed, table)
+        print(f"-- {nclient:,} clients, {len(client):,} holdings")
+        results[nclient] = case = {}
+
+        # Single pre-trade checks: the reference engine and the incremental account
+        sample = rng.integers(0, nclient, min(repeat, nclient))
+        portofolios = []
+        for index in sample:
+            rows = client == index
+            portofolio = {"CASHT2": cash[index]}
+            for stock, held, value in zip(stock_id[rows], lot[rows], price[rows]):
+                portofolio[str(table.code[stock])] = {"lot": held, "price": value}
+            portofolios.append(portofolio)
+        checks = iter(portofolios * repeat)
+        report(case, "pre-trade check, tradinglimit()", timeit(lambda: tl.tradinglimit(account, "BBCA", next(checks)), repeat), 1)
+        accounts = [Account(account, portofolio) for portofolio in portofolios]
+        checks = iter(accounts * repeat)
+        report(case, "pre-trade check, Account", timeit(lambda: next(checks).tradinglimit("BBCA"), repeat), 1)
+
+        # Full-book recompute
+        report(case, "full book, tradinglimitbatch()",
+            timeit(lambda: tl.tradinglimitbatch(account, "BBCA", client, stock_id, lot, price, cash, table=table), repeat), nclient)
+        report(case, "full book, tradinglimitexact()",
+            timeit(lambda: tl.tradinglimitexact(account, "BBCA", client, stock_id, lot, price, cash, table=table), repeat), nclient)
+        report(case, "full book, tradinglimittensor()",
+            timeit(lambda: tl.tradinglimittensor("BBCA", client, stock_id, lot, price, cash, table=table), repeat), nclient)
+
+        # All stocks for one portofolio
+        checks = iter(portofolios * repeat)
+        report(case, "all stocks, tradinglimitall()",
+            timeit(lambda: tl.tradinglimitall(account, next(checks), table=table), repeat), len(table))
+    return results
+
+def regressions(results, baseline, tolerance=0.25):
+    """Cases whose p50 is more than tolerance slower than in baseline"""
+    slower = []
+    for nclient, case in results.items():
+        for name, result in case.items():
+            before = baseline.get(str(nclient), {}).get(name)
+            if before and result["p50"] > before["p50"] * (1 + tolerance):
+                slower.append((nclient, name, before["p50"], result["p50"]))
+    return slower
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the trading limit engines on synthetic client books")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000, 100000])
+    parser.add_argument("--max-holding", type=int, default=50)
+    parser.add_argument("--account", default="FREE")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.max_holding, args.account, args.repeat, args.seed)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for nclient, name, before, after in slower:
+            print(f"REGRESSION {nclient:,} clients, {name}: p50 {before:.3f} ms -> {after:.3f} ms")
+        sys.exit(1 if slower else 0)
@@ -0,0 +1,127 @@
+import os
+import numpy as np
+import pandas as pd
+import tradinglimit as tl
+
+# Book files have one row per holding (client, code, lot, price); a "CASHT2" row
+# carries the client's cash in price, as the "CASHT2" key does in a portofolio dict
+COLUMNS = ["client", "code", "lot", "price"]
+BOOKDTYPE = {"client": str, "code": str, "lot": np.float64, "price": np.float64}
+
+def bookarrays(client, code, lot, price, table=None):
+    """Book rows as the batch engines take them, without any per-client dict.
+
+    Clients are numbered in order of first appearance and codes become stock ids in
+    one lookup on the haircut index; CASHT2 rows are summed into cash. Returns
+    clients, then client, stock_id, lot and price per holding, then cash aligned
+    with clients. Unknown codes raise KeyError.
+    """
+    table = tl.gethaircuttable() if table is None else table
+    code = np.asarray(code, dtype=str)
+    lot = np.asarray(lot, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    client, clients = pd.factorize(np.asarray(client, dtype=str))
+    client = client.astype(np.intp)
+    iscash = code == "CASHT2"
+    cash = np.bincount(client[iscash], weights=price[iscash], minlength=len(clients))
+    held = ~iscash
+    return (np.asarray(clients, dtype=str), client[held], table.stockid(code[held]),
+        lot[held], price[held], cash)
+
+def readbook(path, table=None):
+    """bookarrays() of a book file: .parquet (needs pyarrow), .npz or .csv"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".parquet":
+        frame = pd.read_parquet(path, columns=COLUMNS)
+        columns = [frame[name].to_numpy() for name in COLUMNS]
+    elif extension == ".npz":
+        with np.load(path, allow_pickle=False) as data:
+            columns = [data[name] for name in COLUMNS]
+    elif extension == ".csv":
+        frame = pd.read_csv(path, usecols=COLUMNS, dtype=BOOKDTYPE)
+        columns = [frame[name].to_numpy() for name in COLUMNS]
+    else:
+        raise ValueError(f"Unknown book format {extension!r}: expected .parquet, .npz or .csv")
+    return bookarrays(*columns, table=table)
+
+def readchunks(path, chunksize=1000000):
+    """Yield the book columns (client, code, lot, price) of a book file, chunksize rows at a time.
+
+    CSV and Parquet (needs pyarrow) are read incrementally; NPZ is loaded whole and sliced.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        for frame in pd.read_csv(path, usecols=COLUMNS, dtype=BOOKDTYPE, chunksize=chunksize):
+            yield [frame[name].to_numpy() for name in COLUMNS]
+    elif extension == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=COLUMNS):
+            yield [batch.column(name).to_numpy(zero_copy_only=False) for name in COLUMNS]
+    elif extension == ".npz":
+        with np.load(path, allow_pickle=False) as data:
+            columns = [data[name] for name in COLUMNS]
+        for start in range(0, len(columns[0]), chunksize):
+            yield [column[start:start + chunksize] for column in columns]
+    else:
+        raise ValueError(f"Unknown book format {extension!r}: expected .parquet, .npz or .csv")
+
+def iterbook(path, chunksize=1000000):
+    """readchunks() regrouped so that no client is split across chunks.
+
+    The rows of the last client of a chunk are carried over to the next one, so the
+    rows of every client must be contiguous in the file, as in a dump sorted by client.
+    A client that comes back after its rows ended raises ValueError; finished clients
+    are remembered as one 64-bit hash each.
+    """
+    carry = None
+    seen = np.empty(0, dtype=np.uint64)
+    for columns in readchunks(path, chunksize):
+        if carry is not None:
+            columns = [np.concatenate([before, after]) for before, after in zip(carry, columns)]
+        client = columns[0]
+        if not len(client):
+            continue
+        start = np.flatnonzero(np.r_[True, client[1:] != client[:-1]])
+        run = pd.util.hash_array(np.asarray(client[start], dtype=object))
+        _, first, count = np.unique(run, return_index=True, return_counts=True)
+        again = np.isin(run, seen) | np.isin(run, run[first[count > 1]])
+        if again.any():
+            raise ValueError(f"Book {path} is not grouped by client: rows of {client[start][again][0]} "
+                "are not contiguous; sort it by client or use tradinglimiteod")
+        cut = start[-1]
+        carry = [column[cut:] for column in columns]
+        if cut:
+            seen = np.union1d(seen, run[:-1])
+            yield [column[:cut] for column in columns]
+    if carry is not None and len(carry[0]):
+        yield carry
+
+def writebook(path, clients, client, stock_code, lot, price, cash, table=None):
+    """Write struct-of-arrays holdings and cash, e.g. from tl.flattenportofolio(), as a book file.
+
+    stock_code may be codes or stock ids of table. Every client gets a CASHT2 row, and
+    the rows of a client are contiguous.
+    """
+    table = tl.gethaircuttable() if table is None else table
+    stock_code = np.asarray(stock_code)
+    if stock_code.dtype.kind in "iu":
+        stock_code = table.code[stock_code]
+    clients = np.asarray(clients, dtype=str)
+    # Rows grouped by client, CASHT2 first, so that the file can be read by iterbook()
+    client = np.concatenate([np.arange(len(clients)), np.asarray(client, dtype=np.intp)])
+    order = np.argsort(client, kind="stable")
+    columns = {
+        "client": clients[client[order]],
+        "code": np.concatenate([np.full(len(clients), "CASHT2"), np.asarray(stock_code, dtype=str)])[order],
+        "lot": np.concatenate([np.zeros(len(clients)), np.asarray(lot, dtype=np.float64)])[order],
+        "price": np.concatenate([np.asarray(cash, dtype=np.float64), np.asarray(price, dtype=np.float64)])[order],
+    }
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".parquet":
+        pd.DataFrame(columns).to_parquet(path, index=False)
+    elif extension == ".npz":
+        np.savez(path, **columns)
+    elif extension == ".csv":
+        pd.DataFrame(columns).to_csv(path, index=False)
+    else:
+        raise ValueError(f"Unknown book format {extension!r}: expected .parquet, .npz or .csv")
@@ -0,0 +1,149 @@
+import copy
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import tradinglimit as tl
+import tradinglimittestcase as tc
+
+# Capping candidates in rupiah: every 0.5B up to 20B, plus no capping at all
+CAPPINGGRID = np.append(np.arange(0, 20.5, 0.5) * 1000000000, np.inf)
+
+def features(cases, capping, table=None):
+    """[row, 1 + class] regressors: cash, then the capped collateral of every class.
+
+    With cappings fixed the limit is linear in the products of HYPARAM values:
+        TL = (EBR_X * MC_X) * cash + sum_c (EBR_X * MS_c) * sum_{k in c} min(MV_k * (1 - h_k), CAP_c)
+    """
+    table = tl.gethaircuttable() if table is None else table
+    nrow, nclass = len(cases["cash"]), len(tl.CLASS)
+    stock_id = table.stockid(cases["stock_code"])
+    stock_class = table.classof(stock_id)
+    value = cases["lot"] * 100 * cases["price"] * (1 - table.haircut[stock_id])
+    collateral = np.bincount(cases["client"] * nclass + stock_class, weights=np.minimum(value, capping[stock_class]),
+        minlength=nrow * nclass).reshape(nrow, nclass)
+    return np.column_stack([cases["cash"], collateral])
+
+def fitproducts(cases, capping, buy_class, tolerance=10000, iterations=20, table=None):
+    """Least absolute deviations of the products per buy class; returns coefficients [class, 1 + class] and residuals.
+
+    Solved by reweighted least squares with weights 1 / max(|residual|, tolerance), so a
+    few outliers cannot pull the cases that already match away from their values.
+    """
+    x = features(cases, capping, table)
+    y = cases["expected"]
+    coefficient = np.full((len(tl.CLASS), x.shape[1]), np.nan)
+    residual = np.zeros(len(y))
+    for label in np.unique(buy_class):
+        rows = buy_class == label
+        # Regressors that are zero on every row cannot be identified; leave them out
+        used = np.any(x[rows] != 0, axis=0)
+        coefficient[label] = 0
+        if used.any():
+            a, b = x[rows][:, used], y[rows]
+            weight = np.ones(len(b))
+            for _ in range(iterations):
+                root = np.sqrt(weight)
+                fit = np.linalg.lstsq(a * root[:, None], b * root, rcond=None)[0]
+                weight = 1 / np.maximum(np.abs(a @ fit - b), tolerance)
+            coefficient[label, used] = fit
+        residual[rows] = x[rows] @ coefficient[label] - y[rows]
+    return coefficient, residual
+
+def score(residual, tolerance=10000):
+    """Cases beyond tolerance, then total absolute residual: lower is better"""
+    return np.sum(np.abs(residual) > tolerance), np.sum(np.abs(residual))
+
+def searchcapping(cases, buy_class, capping, grid=CAPPINGGRID, sweeps=3, tolerance=10000, table=None):
+    """Coordinate search of the capping of every held class over grid, minimizing score()"""
+    table = tl.gethaircuttable() if table is None else table
+    held = np.unique(table.classof(table.stockid(cases["stock_code"])))
+    capping = capping.astype(np.float64)
+    best = score(fitproducts(cases, capping, buy_class, tolerance, table=table)[1], tolerance)
+    for _ in range(sweeps):
+        improved = False
+        for label in held:
+            for candidate in grid:
+                trial = capping.copy()
+                trial[label] = candidate
+                error = score(fitproducts(cases, trial, buy_class, tolerance, table=table)[1], tolerance)
+                if error[0] < best[0] or (error[0] == best[0] and error[1] < best[1] * (1 - 1e-12)):
+                    best, capping, improved = error, trial, True
+        if not improved:
+            break
+    return capping
+
+def calibrate(cases, account="FREE", grid=CAPPINGGRID, tolerance=10000, table=None):
+    """Fit the HYPARAM values of account to recorded cases.
+
+    Cappings are searched over grid; for fixed cappings the products EBR_X * MC_X and
+    EBR_X * MS_c are linear least squares per buy class X. The products fix the values
+    only up to scale, so EBR of the buy class with the most cases keeps its HYPARAM value,
+    and values the cases cannot identify are left as they are. When the fit does not bring
+    more cases within tolerance, HYPARAM is kept.
+    Returns the fitted HYPARAM and the per-case residual report.
+    """
+    table = tl.gethaircuttable() if table is None else table
+    labels = list(tl.CLASS)
+    buy_class = table.classof(table.stockid(cases["stock_buy"]))
+    capping = searchcapping(cases, buy_class, tl.PARAM[tl.ACCOUNTID[account], tl.CAP].copy(), grid,
+        tolerance=tolerance, table=table)
+    coefficient, _ = fitproducts(cases, capping, buy_class, tolerance, table=table)
+
+    hyparam = copy.deepcopy(tl.HYPARAM)
+    fitted = hyparam[account]
+    reference = np.bincount(buy_class, minlength=len(labels)).argmax()
+    ebr = np.array([fitted["EFFECTIVEBUYRATE"][label] for label in labels], dtype=np.float64)
+    ms = np.array([fitted["MULTIPLIERSTOCK"][label] for label in labels], dtype=np.float64)
+    if ebr[reference]:
+        known = ~np.isnan(coefficient[reference, 1:]) & (coefficient[reference, 1:] != 0)
+        ms[known] = coefficient[reference, 1:][known] / ebr[reference]
+    for label in np.unique(buy_class):
+        ratio = coefficient[label, 1:] / np.where(ms > 0, ms, np.nan)
+        ratio = ratio[np.isfinite(ratio) & (coefficient[label, 1:] != 0)]
+        if label != reference and len(ratio):
+            ebr[label] = np.median(ratio)
+        if ebr[label]:
+            fitted["MULTIPLIERCASH"][labels[label]] = float(coefficient[label, 0] / ebr[label])
+    for index, label in enumerate(labels):
+        fitted["EFFECTIVEBUYRATE"][label] = float(ebr[index])
+        fitted["MULTIPLIERSTOCK"][label] = float(ms[index])
+        fitted["CAPPING"][label] = float(capping[index] / 1000000000)
+    report = validate(cases, account, hyparam, table)
+    current = validate(cases, account, table=table)
+    if score(report["residual"], tolerance) >= score(current["residual"], tolerance):
+        return copy.deepcopy(tl.HYPARAM), current
+    return hyparam, report
+
+def validate(cases, account="FREE", hyparam=None, table=None):
+    """Per-case predicted limit, expected limit and residual under hyparam (HYPARAM by default)"""
+    param = tl.compileparam(tl.HYPARAM if hyparam is None else hyparam)
+    predicted = tl.tradinglimitbatch(account, cases["stock_buy"], cases["client"], cases["stock_code"],
+        cases["lot"], cases["price"], cases["cash"], table=table, param=param)
+    return pd.DataFrame({
+        "case": cases["case"],
+        "stock_buy": cases["stock_buy"],
+        "predicted": predicted,
+        "expected": cases["expected"],
+        "residual": predicted - cases["expected"],
+    })
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit and validate HYPARAM against recorded trading limit cases")
+    parser.add_argument("--account", default="FREE")
+    parser.add_argument("--data", default=tc.CASEPATH)
+    parser.add_argument("--tolerance", type=float, default=10000)
+    parser.add_argument("--grid-step", type=float, default=0.5, help="capping grid step, in billions")
+    args = parser.parse_args()
+    grid = np.append(np.arange(0, 20 + args.grid_step, args.grid_step) * 1000000000, np.inf)
+
+    start = time.perf_counter()
+    cases = tc.loadcases(args.data)
+    before = validate(cases, args.account)
+    hyparam, after = calibrate(cases, args.account, grid, args.tolerance)
+    print(f"{len(before)} cases in {time.perf_counter() - start:.2f} s")
+    for name, report in (("HYPARAM", before), ("fitted", after)):
+        print(f"{name}: {np.sum(np.abs(report['residual']) > args.tolerance)} beyond tolerance, "
+            f"max |residual| {np.max(np.abs(report['residual'])):,.0f}")
+    print(pd.DataFrame(hyparam[args.account]).T.to_string())
+    print(after.to_string(index=False))
@@ -0,0 +1,46 @@
+import sys
+import time
+import argparse
+import pandas as pd
+import tradinglimit as tl
+import tradinglimitbook as tb
+from tradinglimiteod import ResultWriter
+
+def streamlimits(book, output="-", account=("FREE",), stock_buy=("BBCA",), chunksize=1000000, table=None):
+    """Limits of every client of a book file, streamed chunk by chunk to output.
+
+    One result row per client and account, with a limit_<code> column per stock_buy.
+    Memory holds one chunk of the book whatever its size; the rows of a client must be
+    contiguous (see tb.iterbook). output is a .parquet or .csv file, or "-" for stdout.
+    Returns the number of clients and holdings read.
+    """
+    table = tl.gethaircuttable() if table is None else table
+    writer = ResultWriter(output)
+    nclient = nholding = 0
+    try:
+        for columns in tb.iterbook(book, chunksize):
+            clients, client, stock_id, lot, price, cash = tb.bookarrays(*columns, table=table)
+            for name in account:
+                result = pd.DataFrame({"client": clients, "account": name})
+                for code in stock_buy:
+                    result[f"limit_{code}"] = tl.tradinglimitbatch(name, code, client, stock_id, lot, price, cash, table=table)
+                writer.write(result)
+            nclient += len(clients)
+            nholding += len(client)
+    finally:
+        writer.close()
+    return nclient, nholding
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trading limits of every client of a book file, in constant memory")
+    parser.add_argument("book", help=".csv, .parquet or .npz with client, code, lot, price, grouped by client; "
+        "CASHT2 rows carry cash in price")
+    parser.add_argument("output", nargs="?", default="-", help="result file, .parquet (pyarrow) or .csv; stdout by default")
+    parser.add_argument("--account", nargs="+", default=["FREE"], choices=tl.ACCOUNT)
+    parser.add_argument("--stock-buy", nargs="+", default=["BBCA"])
+    parser.add_argument("--chunksize", type=int, default=1000000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    nclient, nholding = streamlimits(args.book, args.output, args.account, args.stock_buy, args.chunksize)
+    print(f"{nclient:,} clients, {nholding:,} holdings in {time.perf_counter() - start:.2f} s", file=sys.stderr)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import tradinglimit as tl
+
+# Price moves of the daily risk report, -30% to +30% by 1%
+GRID = np.round(np.arange(-30, 31) / 100, 2)
+
+def breakpoints(account="FREE", client=(), stock_code=(), lot=(), price=(), table=None, param=None):
+    """Move and price at which every holding reaches its class CAPPING.
+
+    A holding contributes MULTIPLIERSTOCK * min(MV * (1 - haircut), CAPPING), linear in its
+    price up to move* = CAPPING / (MV * (1 - haircut)) - 1 and flat beyond. Holdings that
+    never reach CAPPING get inf. Returns a DataFrame aligned with the holdings.
+    """
+    table = tl.gethaircuttable() if table is None else table
+    param = (tl.PARAM if param is None else param)[tl.ACCOUNTID[account]]
+    stock_id = table.stockid(np.asarray(stock_code))
+    lot = np.asarray(lot, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    value = lot * 100 * price * (1 - table.haircut[stock_id])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        move = np.where(value > 0, param[tl.CAP, table.classof(stock_id)] / value - 1, np.inf)
+    return pd.DataFrame({
+        "client": np.asarray(client, dtype=np.intp),
+        "stock_code": table.code[stock_id],
+        "move": move,
+        "price": price * (1 + move),
+    })
+
+def limitcurve(account="FREE", stock_buy="BBCA", client=(), stock_code=(), lot=(), price=(), cash=(), grid=GRID,
+        codes=None, clients=None, table=None, param=None):
+    """Limit of every client when prices move by each of grid (fractions), from the breakpoints.
+
+    At move m a holding is below CAPPING when m < move*, so
+        TL(m) = EBR_X * (MC_X * cash + sum_capped MS * CAPPING + (1 + m) * sum_below MS * MV * (1 - haircut))
+    Every holding is binned once at its breakpoint and both sums follow from cumulative
+    sums along the grid, instead of one evaluation per grid point. codes limits the move
+    to those stocks; the other holdings keep their price. The book is given as in
+    tl.tradinglimitbatch. Returns a DataFrame of clients x grid moves.
+    """
+    table = tl.gethaircuttable() if table is None else table
+    param = (tl.PARAM if param is None else param)[tl.ACCOUNTID[account]]
+    grid = np.asarray(grid, dtype=np.float64)
+    if np.any(np.diff(grid) <= 0):
+        raise ValueError("grid must be strictly increasing")
+    cash = np.asarray(cash, dtype=np.float64)
+    client = np.asarray(client, dtype=np.intp)
+    lot = np.asarray(lot, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    stock_id = table.stockid(np.asarray(stock_code))
+    stock_class = table.classof(stock_id)
+    buy_class = table.classof(np.broadcast_to(table.stockid(stock_buy), cash.shape))
+
+    multiplier = param[tl.MS, stock_class]
+    capping = param[tl.CAP, stock_class]
+    value = lot * 100 * price * (1 - table.haircut[stock_id])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        move = np.where(value > 0, capping / value - 1, np.inf)
+    moving = np.ones(len(client), dtype=bool) if codes is None else np.isin(stock_id, table.stockid(np.asarray(codes)))
+
+    # Holdings that do not move add a constant; the others are binned at their breakpoint:
+    # bin b means below CAPPING at grid[:b] and capped from grid[b] on
+    nclient, ngrid = len(cash), len(grid)
+    fixed = np.bincount(client[~moving], weights=(multiplier * np.minimum(value, capping))[~moving], minlength=nclient)
+    key = client[moving] * (ngrid + 1) + np.searchsorted(grid, move[moving], side="left")
+    capped = np.bincount(key, weights=(multiplier * capping)[moving], minlength=nclient * (ngrid + 1)) \
+        .reshape(nclient, ngrid + 1).cumsum(axis=1)[:, :ngrid]
+    below = np.bincount(key, weights=(multiplier * value)[moving], minlength=nclient * (ngrid + 1)) \
+        .reshape(nclient, ngrid + 1)[:, ::-1].cumsum(axis=1)[:, ::-1][:, 1:]
+    limit = (param[tl.MC, buy_class] * cash + fixed)[:, None] + capped + (1 + grid) * below
+    limit *= param[tl.EBR, buy_class][:, None]
+
+    index = pd.Index(range(nclient) if clients is None else clients, name="client")
+    return pd.DataFrame(limit, index=index, columns=pd.Index(grid, name="move"))
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import tradinglimit as tl
+import tradinglimitshm as shm
+import tradinglimitbook as tb
+
+def shardbook(path, folder, nshard, chunksize=1000000):
+    """Split a book file (.csv, .parquet or .npz) into nshard CSV files by client hash, one chunk in memory at a time"""
+    paths = [os.path.join(folder, f"shard{index}.csv") for index in range(nshard)]
+    for columns in tb.readchunks(path, chunksize):
+        chunk = pd.DataFrame(dict(zip(tb.COLUMNS, columns)))
+        shard = pd.util.hash_array(np.asarray(chunk["client"], dtype=object)) % nshard
+        for index, part in chunk.groupby(shard):
+            part.to_csv(paths[index], mode="a", header=not os.path.exists(paths[index]), index=False)
+    return [path for path in paths if os.path.exists(path)]
+
+def computeshard(path, account="FREE", stock_buy=("BBCA",)):
+    """Limits of every client in one shard file, with the seconds spent reading and computing"""
+    start = time.perf_counter()
+    clients, client, stock_id, lot, price, cash = tb.readbook(path)
+    read = time.perf_counter()
+    result = pd.DataFrame({"client": clients, "account": account})
+    for code in stock_buy:
+        result[f"limit_{code}"] = tl.tradinglimitbatch(account, code, client, stock_id, lot, price, cash)
+    end = time.perf_counter()
+    return result, {"shard": os.path.basename(path), "clients": len(clients), "holdings": len(client),
+        "read": read - start, "compute": end - read}
+
+class ResultWriter:
+    """Appends result frames to a Parquet file (needs pyarrow) or a CSV file, by extension; "-" is CSV on stdout"""
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self.writer = None
+        self.header = True
+        if self.parquet:
+            # Imported here so that a missing pyarrow fails before any limit is computed
+            import pyarrow
+            import pyarrow.parquet
+            self.pa = pyarrow
+
+    def write(self, frame):
+        if self.parquet:
+            table = self.pa.Table.from_pandas(frame, preserve_index=False)
+            if self.writer is None:
+                self.writer = self.pa.parquet.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        elif self.path == "-":
+            frame.to_csv(sys.stdout, header=self.header, index=False)
+            self.header = False
+        else:
+            frame.to_csv(self.path, mode="w" if self.header else "a", header=self.header, index=False)
+            self.header = False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def endofday(book, output, nshard=16, workers=None, account="FREE", stock_buy=("BBCA",), chunksize=1000000):
+    """Shard book, compute every shard on a process pool and stream the results to output.
+
+    Shards are written to a temporary folder first, so neither the parent nor a worker
+    holds more than a chunk or a shard. Returns the timing of every shard.
+    """
+    start = time.perf_counter()
+    block, handle = shm.sharehaircut()
+    timings = []
+    writer = ResultWriter(output)
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            paths = shardbook(book, folder, nshard, chunksize)
+            print(f"sharded into {len(paths)} files in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+            with ProcessPoolExecutor(workers, initializer=shm.initworker, initargs=(handle,)) as pool:
+                futures = [pool.submit(computeshard, path, account, tuple(stock_buy)) for path in paths]
+                for future in as_completed(futures):
+                    result, timing = future.result()
+                    writer.write(result)
+                    timings.append(timing)
+                    print(f"{timing['shard']:>12} {timing['clients']:>10,} clients {timing['holdings']:>12,} holdings"
+                        f" read {timing['read']:8.2f} s compute {timing['compute']:8.2f} s", file=sys.stderr)
+    finally:
+        writer.close()
+        block.close()
+        block.unlink()
+    print(f"total {time.perf_counter() - start:.2f} s", file=sys.stderr)
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-of-day trading limit recompute over a sharded client book")
+    parser.add_argument("book", help=".csv, .parquet or .npz with client, code, lot, price; CASHT2 rows carry cash in price")
+    parser.add_argument("output", help="result file, .parquet (pyarrow) or .csv")
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--account", default="FREE")
+    parser.add_argument("--stock-buy", nargs="+", default=["BBCA"])
+    parser.add_argument("--chunksize", type=int, default=1000000)
+    args = parser.parse_args()
+    endofday(args.book, args.output, args.shards, args.workers, args.account, args.stock_buy, args.chunksize)
@@ -0,0 +1,151 @@
+import os
+import re
+import glob
+import numpy as np
+import pandas as pd
+import tradinglimit as tl
+
+REPORTPATTERN = os.path.join(tl.FOLDER, ".ignore", "HCPROFINDO_*.txt")
+
+def readhaircutreport(path):
+    """Effective date, codes and Profindo haircuts (percent) of one HCPROFINDO report"""
+    date = None
+    code, haircut = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            m = re.match(r"\s*\d+\.;([^;]+); *([\d.]+) %; *([\d.]+) %;", line)
+            if m:
+                code.append(m.group(1).strip())
+                haircut.append(float(m.group(3)))
+            elif date is None:
+                d = re.search(r"As Of Date: *(\d{2}-\w{3}-\d{4})", line)
+                if d:
+                    date = pd.to_datetime(d.group(1), format="%d-%b-%Y")
+    if date is None:
+        # HCPROFINDO_251204.txt
+        date = pd.to_datetime(re.search(r"(\d{6})", os.path.basename(path)).group(1), format="%y%m%d")
+    return np.datetime64(date.date(), "D"), np.array(code, dtype=str), np.array(haircut, dtype=np.float64)
+
+def asofjoin(left_key, left_date, right_key, right_date):
+    """Row of right with the same integer key and the latest date on or before left_date, -1 where none"""
+    left_key = np.asarray(left_key, dtype=np.int64)
+    right_key = np.asarray(right_key, dtype=np.int64)
+    left_date = np.asarray(left_date, dtype="datetime64[D]").astype(np.int64)
+    right_date = np.asarray(right_date, dtype="datetime64[D]").astype(np.int64)
+    if len(right_key) == 0:
+        return np.full(len(left_key), -1, dtype=np.intp)
+    # One sorted int64 key per row: key-major, date-minor
+    base = min(left_date.min(initial=right_date.min()), right_date.min())
+    span = max(left_date.max(initial=right_date.max()), right_date.max()) - base + 1
+    order = np.lexsort((right_date, right_key))
+    right = right_key[order] * span + (right_date[order] - base)
+    position = np.searchsorted(right, left_key * span + (left_date - base), side="right") - 1
+    found = (position >= 0) & (right_key[order][np.maximum(position, 0)] == left_key)
+    return np.where(found, order[np.maximum(position, 0)], -1)
+
+class HaircutHistory:
+    """Haircut tables by effective date, looked up as of any date by binary search.
+
+    Each version is a full report: a code missing from a report is not marginable as of
+    that date, so it is NaN in that version rather than carried forward.
+    """
+    def __init__(self, dates, codes, haircuts):
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        order = np.argsort(dates, kind="stable")
+        self.dates = dates[order]
+        if len(np.unique(self.dates)) < len(self.dates):
+            raise ValueError("Two haircut reports share one effective date")
+        tables = [tl.HaircutTable(codes[version], haircuts[version]) for version in order]
+        self.code = np.asarray(pd.unique(np.concatenate([table.code for table in tables])), dtype=str)
+        self.index = pd.Index(self.code)
+        self.haircut = np.full((len(tables), len(self.code)), np.nan)
+        for version, table in enumerate(tables):
+            self.haircut[version, self.index.get_indexer(table.code)] = table.haircut
+        self.classid = tl.classify(self.haircut)
+
+    @classmethod
+    def fromreports(cls, paths=None):
+        """History of the HCPROFINDO reports at paths, by default every one in .ignore"""
+        paths = sorted(glob.glob(REPORTPATTERN)) if paths is None else paths
+        reports = [readhaircutreport(path) for path in paths]
+        return cls([date for date, _, _ in reports], [code for _, code, _ in reports],
+            [haircut / 100 for _, _, haircut in reports])
+
+    def asof(self, date):
+        """Version in force on date, for one date or an array of dates"""
+        date = np.asarray(date, dtype="datetime64[D]")
+        version = np.searchsorted(self.dates, date, side="right") - 1
+        if np.any(version < 0):
+            raise ValueError(f"No haircut report on or before {np.min(date)}")
+        return version
+
+    def table(self, date):
+        """The HaircutTable in force on date, for the tl engines"""
+        version = self.asof(date)
+        listed = ~np.isnan(self.haircut[version])
+        return tl.HaircutTable(self.code[listed], self.haircut[version, listed])
+
+    def lookup(self, date, stock_code, strict=True):
+        """Haircut and class id of each (date, stock_code) pair, as of that date.
+
+        A code missing from the report in force raises KeyError, or with strict=False is
+        not marginable: a 100% haircut, in the class of a 100% haircut.
+        """
+        version = self.asof(date)
+        stock_id = tl.lookupstock(self.index, stock_code)
+        haircut = self.haircut[version, stock_id]
+        classid = self.classid[version, stock_id]
+        missing = np.isnan(haircut)
+        if np.any(missing) and strict:
+            missing = np.atleast_1d(missing)
+            first = np.flatnonzero(missing)[0]
+            date = np.broadcast_to(np.asarray(date, dtype="datetime64[D]"), missing.shape)[first]
+            code = np.atleast_1d(self.code[stock_id])[first]
+            raise KeyError(f"{missing.sum()} holding(s) not in the haircut report in force, e.g. {code} on {date}")
+        if np.any(missing):
+            haircut = np.where(missing, 1.0, haircut)
+            classid = np.where(missing, tl.classify(1.0), classid).astype(np.int8)
+        if np.any(classid < 0):
+            raise ValueError("Haircut outside every CLASS range in the report in force")
+        return haircut, classid
+
+def tradinglimitasof(history, account="FREE", stock_buy="BBCA", date=(), client=(), stock_code=(), lot=(), price=(), cash=(), param=None):
+    """Trading limit of client snapshots, each under the haircuts in force on its date.
+
+    Like tl.tradinglimitbatch, but date is aligned with cash so every snapshot
+    (a client on a date) is evaluated as of its own date in the same pass. Stocks
+    missing from the report in force are not marginable, see HaircutHistory.lookup.
+    """
+    param = (tl.PARAM if param is None else param)[tl.ACCOUNTID[account]]
+    date = np.asarray(date, dtype="datetime64[D]")
+    client = np.asarray(client, dtype=np.intp)
+    haircut, stock_class = history.lookup(date[client], np.asarray(stock_code), strict=False)
+    _, buy_class = history.lookup(date, np.broadcast_to(np.asarray(stock_buy), date.shape), strict=False)
+    collateral, _ = tl.collateralcore(param, haircut, stock_class, lot, price)
+    return tl.tradinglimitcore(param, client, collateral, cash, buy_class)
+
+def backfill(history, dates, account="FREE", stock_buy="BBCA", client=(), stock_code=(), lot=(), cash=(), price_date=(), price_code=(), close=(), clients=None):
+    """Limits of a fixed book on every date, joining closes and haircuts as of each date.
+
+    client, stock_code, lot and cash describe the book as in tl.tradinglimitbatch;
+    price_date, price_code and close are the price history, carried forward to dates.
+    Returns a DataFrame of dates by clients.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    client = np.asarray(client, dtype=np.intp)
+    cash = np.asarray(cash, dtype=np.float64)
+    stock_id = tl.lookupstock(history.index, np.asarray(stock_code))
+    price_id = tl.lookupstock(history.index, np.asarray(price_code))
+    nclient, nholding = len(cash), len(client)
+
+    # Every holding on every date: snapshot = day * nclient + client
+    day = np.repeat(np.arange(len(dates)), nholding)
+    row = asofjoin(np.tile(stock_id, len(dates)), dates[day], price_id, price_date)
+    if np.any(row < 0):
+        raise ValueError("Holding without a close on or before the date it is evaluated")
+    limit = tradinglimitasof(history, account, stock_buy, np.repeat(dates, nclient),
+        day * nclient + np.tile(client, len(dates)), np.tile(stock_id, len(dates)),
+        np.tile(np.asarray(lot, dtype=np.float64), len(dates)), np.asarray(close, dtype=np.float64)[row],
+        np.tile(cash, len(dates)))
+    return pd.DataFrame(limit.reshape(len(dates), nclient), index=pd.DatetimeIndex(dates, name="date"),
+        columns=clients)
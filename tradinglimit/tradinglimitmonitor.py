@@ -0,0 +1,70 @@
+import heapq
+import numpy as np
+from tradinglimitstream import LimitStream
+
+class MarginMonitor:
+    """Accounts ordered by headroom (trading limit minus exposure), closest to breach first.
+
+    Limits are maintained by a LimitStream. Each change pushes a fresh heap entry and
+    stale entries are dropped as they surface, so an update costs O(log n) and the
+    top-N query O(N log n) without rescanning the book. exposure is what each client's
+    limit has to cover, e.g. open buy orders or unsettled purchases. Clients whose
+    headroom falls below threshold are returned by every update as soon as it happens,
+    which is how D/E/F zero-multiplier drops surface.
+    """
+    def __init__(self, client, stock_code, lot, price, cash, exposure, account="FREE", stock_buy="BBCA", threshold=0.0, table=None, param=None):
+        self.stream = LimitStream(client, stock_code, lot, price, cash, account=account, stock_buy=stock_buy, table=table, param=param)
+        self.exposure = np.array(exposure, dtype=np.float64)
+        self.threshold = threshold
+        self.version = np.zeros(len(self.exposure), dtype=np.int64)
+        self.breached = self.headroom() < threshold
+        self.rebuild()
+
+    def headroom(self, clients=slice(None)):
+        return self.stream.limit[clients] - self.exposure[clients]
+
+    def rebuild(self):
+        self.heap = [(headroom, index, self.version[index]) for index, headroom in enumerate(self.headroom())]
+        heapq.heapify(self.heap)
+
+    def push(self, clients):
+        """Requeue clients at their current headroom; returns those that just crossed below threshold"""
+        clients = np.unique(np.asarray(clients, dtype=np.intp))
+        self.version[clients] += 1
+        headroom = self.headroom(clients)
+        for index, value in zip(clients, headroom):
+            heapq.heappush(self.heap, (value, index, self.version[index]))
+        # Stale entries are only dropped lazily, so compact once they dominate
+        if len(self.heap) > 4 * len(self.version):
+            self.rebuild()
+        breached = headroom < self.threshold
+        crossed = clients[breached & ~self.breached[clients]]
+        self.breached[clients] = breached
+        return crossed
+
+    def tick(self, stock_code, price):
+        clients, _, _ = self.stream.tick(stock_code, price)
+        return self.push(clients)
+
+    def fill(self, client, stock_code, lot, price, fee=0.0):
+        self.stream.fill(client, stock_code, lot, price, fee=fee)
+        return self.push([client])
+
+    def movecash(self, client, amount):
+        self.stream.movecash(client, amount)
+        return self.push([client])
+
+    def setexposure(self, client, amount):
+        self.exposure[client] = amount
+        return self.push([client])
+
+    def top(self, n=10):
+        """The n clients with the least headroom, as (client, headroom) pairs"""
+        result = []
+        while self.heap and len(result) < n:
+            headroom, index, version = heapq.heappop(self.heap)
+            if version == self.version[index]:
+                result.append((index, headroom))
+        for index, headroom in result:
+            heapq.heappush(self.heap, (headroom, index, self.version[index]))
+        return result
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import tradinglimit as tl
+
+# Classes where the stock stops counting as collateral for most accounts
+DEFCLASS = np.isin(tl.CLASSLABEL, ["D", "E", "F"])
+
+def shock(table, overrides=None, shift=0.0, codes=None):
+    """Haircuts (fractions) of table under a what-if.
+
+    shift adds percentage points to codes (every code when None), clipped to 0-100%
+    and worked in whole basis points so that class bounds stay exact; overrides then
+    sets haircuts in percent, e.g. {"ADMR": 80}.
+    """
+    haircut = table.haircut.copy()
+    if shift:
+        stock_id = slice(None) if codes is None else table.stockid(np.asarray(codes))
+        haircut[stock_id] = np.clip(np.round(haircut[stock_id] * 10000 + shift * 100), 0, 10000) / 10000
+    if overrides:
+        haircut[table.stockid(np.array(list(overrides), dtype=str))] = np.array(list(overrides.values()), dtype=np.float64) / 100
+    return haircut
+
+def runscenarios(scenarios, account="FREE", stock_buy="BBCA", client=(), stock_code=(), lot=(), price=(), cash=(), clients=None, table=None, param=None):
+    """Limits of a whole book under the baseline and every scenario in one pass.
+
+    scenarios maps a name to shock() arguments, e.g. {"ADMR80": {"overrides": {"ADMR": 80}}}.
+    The book is given as in tl.tradinglimitbatch. Returns three DataFrames indexed by
+    client: limit (baseline and every scenario), delta (scenario minus baseline) and
+    flipped (the client holds or buys a stock that moves into class D/E/F).
+    """
+    table = tl.gethaircuttable() if table is None else table
+    param = (tl.PARAM if param is None else param)[tl.ACCOUNTID[account]]
+    names = list(scenarios)
+    cash = np.asarray(cash, dtype=np.float64)
+    client = np.asarray(client, dtype=np.intp)
+    lot = np.asarray(lot, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    stock_id = table.stockid(np.asarray(stock_code))
+    buy_id = np.broadcast_to(table.stockid(stock_buy), cash.shape)
+
+    # [scenario, stock] haircuts and classes, baseline first
+    haircut = np.stack([table.haircut] + [shock(table, **scenarios[name]) for name in names])
+    classid = tl.classify(haircut)
+    if np.any(classid[:, stock_id] < 0) or np.any(classid[:, buy_id] < 0):
+        raise ValueError("A shocked haircut falls outside every CLASS range")
+
+    nscenario, nclient = len(haircut), len(cash)
+    stock_class = classid[:, stock_id]
+    collateral = param[tl.MS, stock_class] * \
+        np.minimum(lot * 100 * price * (1 - haircut[:, stock_id]), param[tl.CAP, stock_class])
+    key = (np.arange(nscenario)[:, None] * nclient + client).ravel()
+    buy_class = classid[:, buy_id]
+    limit = param[tl.MC, buy_class] * cash + \
+        np.bincount(key, weights=collateral.ravel(), minlength=nscenario * nclient).reshape(nscenario, nclient)
+    limit *= param[tl.EBR, buy_class]
+
+    # A stock flips when it is outside D/E/F in the baseline and inside in the scenario
+    flip = DEFCLASS[classid[1:]] & ~DEFCLASS[classid[0]]
+    flipkey = (np.arange(nscenario - 1)[:, None] * nclient + client).ravel()
+    flipped = np.bincount(flipkey, weights=flip[:, stock_id].ravel(), minlength=(nscenario - 1) * nclient) \
+        .reshape(nscenario - 1, nclient) > 0
+    flipped |= flip[:, buy_id]
+
+    index = pd.Index(range(nclient) if clients is None else clients, name="client")
+    limit = pd.DataFrame(limit.T, index=index, columns=["baseline"] + names)
+    delta = limit[names].sub(limit["baseline"], axis=0)
+    flipped = pd.DataFrame(flipped.T, index=index, columns=names)
+    return limit, delta, flipped
@@ -0,0 +1,158 @@
+import json
+import asyncio
+import argparse
+import numpy as np
+import tradinglimit as tl
+from tradinglimitstream import LimitStream
+
+# Body fields every POST path needs; a request without them is answered 400
+FIELDS = {
+    "/check": ("client", "stock"),
+    "/fill": ("client", "stock", "lot", "price"),
+    "/cash": ("client", "amount"),
+    "/tick": ("stock", "price"),
+}
+
+class MicroBatcher:
+    """Coalesces pre-trade checks arriving within window seconds into one vectorized evaluation"""
+    def __init__(self, stream, window=0.002, maxbatch=4096):
+        self.stream = stream
+        self.window = window
+        self.maxbatch = maxbatch
+        self.queue = []
+        self.timer = None
+
+    async def check(self, client, stock_id):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append((client, stock_id, future))
+        if len(self.queue) >= self.maxbatch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        """Evaluate every queued check now"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.queue = self.queue, []
+        if not batch:
+            return
+        client = np.array([client for client, _, _ in batch], dtype=np.intp)
+        stock_id = np.array([stock_id for _, stock_id, _ in batch], dtype=np.intp)
+        try:
+            limits = self.stream.tradinglimit(client, stock_id)
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, _, future), limit in zip(batch, limits):
+            if not future.done():
+                future.set_result(float(limit))
+
+class LimitService:
+    """Pre-trade limit checks over HTTP, with the haircut index and client states in memory.
+
+    POST /check {"client", "stock", "lot", "price"}  limit for buying stock, and whether lot fits
+    POST /fill  {"client", "stock", "lot", "price", "fee"}  executed trade, negative lot sells
+    POST /cash  {"client", "amount"}  deposit or withdrawal
+    POST /tick  {"stock", "price"}  new price for every holder
+    GET  /health
+    Unknown paths answer 404; unknown clients or stocks and malformed requests answer 400.
+    Updates flush the queued checks first, so a check never sees a later update.
+    """
+    def __init__(self, portofolios, account="FREE", window=0.002, maxbatch=4096):
+        clients, client, stock_code, lot, price, cash = tl.flattenportofolio(portofolios)
+        self.clientid = {str(name): index for index, name in enumerate(clients)}
+        self.stream = LimitStream(client, stock_code, lot, price, cash, account=account)
+        self.batcher = MicroBatcher(self.stream, window, maxbatch)
+
+    def client(self, body):
+        try:
+            return self.clientid[str(body["client"])]
+        except KeyError:
+            raise KeyError(f"Unknown client {body.get('client')!r}") from None
+
+    async def handle(self, method, path, body):
+        stream = self.stream
+        if method == "GET" and path == "/health":
+            return {"clients": len(self.clientid), "holdings": stream.size}
+        if method != "POST" or path not in FIELDS:
+            raise LookupError(path)
+        missing = [name for name in FIELDS[path] if name not in body]
+        if missing:
+            raise KeyError(f"Missing field(s) {', '.join(missing)}")
+        if path == "/check":
+            client = self.client(body)
+            stock_id = stream.table.stockid(body["stock"])
+            limit = await self.batcher.check(client, stock_id)
+            value = body.get("lot", 0) * 100 * body.get("price", 0)
+            return {"client": body["client"], "stock": body["stock"], "limit": limit, "value": value, "ok": value <= limit}
+
+        self.batcher.flush()
+        if path == "/fill":
+            stream.fill(self.client(body), body["stock"], body["lot"], body["price"], fee=body.get("fee", 0.0))
+        elif path == "/cash":
+            stream.movecash(self.client(body), body["amount"])
+        else:
+            stream.tick(body["stock"], body["price"])
+        return {"ok": True}
+
+    async def connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = line.decode("latin-1").rstrip("\r\n")
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    parts = request.split(" ")
+                    if len(parts) != 3:
+                        raise ValueError(f"Malformed request line {request!r}")
+                    method, path, _ = parts
+                    result = await self.handle(method, path, json.loads(body) if body else {})
+                    status = "200 OK"
+                except KeyError as error:
+                    # Unknown client or stock code, or a missing field of the body
+                    status, result = ("400 Bad Request", {"error": str(error.args[0] if error.args else error)})
+                except LookupError as error:
+                    status, result = ("404 Not Found", {"error": str(error.args[0] if error.args else path)})
+                except (ValueError, TypeError) as error:
+                    status, result = ("400 Bad Request", {"error": str(error)})
+                payload = json.dumps(result).encode()
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local pre-trade trading limit service with micro-batching")
+    parser.add_argument("book", help="JSON of portofolios keyed by client, in the tl.tradinglimit() format")
+    parser.add_argument("--account", default="FREE")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    parser.add_argument("--max-batch", type=int, default=4096)
+    args = parser.parse_args()
+
+    with open(args.book, "r") as f:
+        service = LimitService(json.load(f), args.account, args.window_ms / 1000, args.max_batch)
+    asyncio.run(service.serve(args.host, args.port))
@@ -0,0 +1,49 @@
+import numpy as np
+from multiprocessing import shared_memory
+import tradinglimit as tl
+
+def layout(ncode, width):
+    """Byte offsets of haircut (float64), code (fixed-width unicode) and classid (int8) in one block"""
+    haircut = 0
+    code = haircut + 8 * ncode
+    classid = code + 4 * width * ncode
+    return haircut, code, classid, classid + ncode
+
+def sharehaircut(table=None):
+    """Copy the haircut table into one shared memory block.
+
+    Returns the SharedMemory, which the owner keeps open and unlinks when the workers
+    are done, and a small picklable handle for attachhaircut() in the workers.
+    """
+    table = tl.gethaircuttable() if table is None else table
+    code = np.asarray(table.code, dtype=str)
+    width = max(code.dtype.itemsize // 4, 1)
+    offset = layout(len(code), width)
+    shm = shared_memory.SharedMemory(create=True, size=max(offset[-1], 1))
+    np.ndarray(len(code), np.float64, shm.buf, offset[0])[:] = table.haircut
+    np.ndarray(len(code), f"<U{width}", shm.buf, offset[1])[:] = code
+    np.ndarray(len(code), np.int8, shm.buf, offset[2])[:] = table.classid
+    return shm, {"name": shm.name, "ncode": len(code), "width": width}
+
+def attachhaircut(handle):
+    """HaircutTable whose arrays are views on the shared block, no copy and no workbook read"""
+    try:
+        shm = shared_memory.SharedMemory(name=handle["name"], track=False)
+    except TypeError:
+        # Before Python 3.13 attaching also registers the block, which is harmless in pool
+        # workers: they share the owner's resource tracker, and it only unlinks at shutdown
+        shm = shared_memory.SharedMemory(name=handle["name"])
+    ncode, width = handle["ncode"], handle["width"]
+    offset = layout(ncode, width)
+    table = tl.HaircutTable.fromarrays(
+        np.ndarray(ncode, f"<U{width}", shm.buf, offset[1]),
+        np.ndarray(ncode, np.float64, shm.buf, offset[0]),
+        np.ndarray(ncode, np.int8, shm.buf, offset[2]))
+    for array in (table.code, table.haircut, table.classid):
+        array.flags.writeable = False
+    table.shm = shm
+    return table
+
+def initworker(handle):
+    """Process pool initializer: attach the shared table and make it the engines' default"""
+    tl.usehaircuttable(attachhaircut(handle))
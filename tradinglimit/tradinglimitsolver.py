@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import tradinglimit as tl
+
+def maxlots(account="FREE", portofolio="", price=None, feerate=0.0, table=None, param=None):
+    """Maximum lots of each candidate stock one portofolio can buy, solved in closed form.
+
+    Buying q lots of X at price p adds X to the collateral, so the order must satisfy
+        q * 100 * p * (1 + feerate) <= EBR_X * (A + MS_X * min((L0 + q) * 100 * p * (1 - h_X), CAP_X))
+    where A is MC_X * CASHT2 plus the collateral of every other holding and L0 the lots
+    of X already held; CASHT2 is left as is, as the purchase only settles at T+2. Both
+    sides are linear in q on either side of the capping breakpoint, so the answer is
+    the smaller of the two linear roots (the first is unbounded when the collateral
+    grows faster than the cost), floored to whole lots.
+
+    price maps candidate codes to their price, by default the stocks held at their
+    portofolio prices; feerate is a fraction of the order value, unlike the rupiah fee
+    of Account.fill and LimitStream.fill. Returns the lots as a Series indexed by candidate code.
+    """
+    table = tl.gethaircuttable() if table is None else table
+    param = (tl.PARAM if param is None else param)[tl.ACCOUNTID[account]]
+    _, _, held_code, held_lot, held_price, cash = tl.flattenportofolio({None: portofolio})
+    held_id = table.stockid(held_code)
+    held_class = table.classof(held_id)
+    contribution = param[tl.MS, held_class] * \
+        np.minimum(held_lot * 100 * held_price * (1 - table.haircut[held_id]), param[tl.CAP, held_class])
+
+    if price is None:
+        price = dict(zip(held_code, held_price))
+    price = pd.Series(price, dtype=np.float64)
+    stock_id = table.stockid(np.asarray(price.index, dtype=str))
+    stock_class = table.classof(stock_id)
+    value = price.to_numpy() * 100
+
+    # Lots and collateral the candidate already has in the portofolio; -1 picks the appended 0
+    position = pd.Index(held_id).get_indexer(stock_id)
+    lot0 = np.append(held_lot, 0)[position]
+    other = contribution.sum() - np.append(contribution, 0)[position]
+
+    ebr = param[tl.EBR, stock_class]
+    ms = param[tl.MS, stock_class]
+    base = ebr * (param[tl.MC, stock_class] * cash[0] + other)
+    net = value * (1 - table.haircut[stock_id])
+    cost = value * (1 + feerate)
+
+    # Below the breakpoint: base + ebr*ms*(lot0 + q)*net - q*cost >= 0
+    slope = ebr * ms * net - cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        uncapped = np.where(slope < 0, (base + ebr * ms * lot0 * net) / -slope, np.inf)
+        # Above the breakpoint: base + ebr*ms*CAP - q*cost >= 0
+        capped = (base + ebr * ms * param[tl.CAP, stock_class]) / cost
+    lots = np.floor(np.minimum(uncapped, capped) * (1 + 1e-12))
+    return pd.Series(np.maximum(lots, 0).astype(np.int64), index=price.index, name=account)
+
+def checklots(account, portofolio, stock_code, lot, price, feerate=0.0):
+    """Whether buying lot of stock_code at price passes the limit, re-evaluating tl.tradinglimit()"""
+    after = {code: dict(info) if code != "CASHT2" else info for code, info in portofolio.items()}
+    held = after.get(stock_code, {"lot": 0})["lot"]
+    after[stock_code] = {"lot": held + lot, "price": price}
+    return lot * 100 * price * (1 + feerate) <= tl.tradinglimit(account, stock_code, after)
@@ -0,0 +1,166 @@
+import sys
+import json
+import socket
+import argparse
+import numpy as np
+import tradinglimit as tl
+
+class LimitStream:
+    """Client limits kept current under a price feed.
+
+    Holdings are stored as struct-of-arrays with a reverse index from stock id to the
+    rows holding it, so a tick revalues only the holders of that stock and recomputes
+    only their limits. account and stock_buy are one value for the book or one per client.
+    """
+    def __init__(self, client, stock_code, lot, price, cash, account="FREE", stock_buy="BBCA", table=None, param=None):
+        self.table = tl.gethaircuttable() if table is None else table
+        self.param = tl.PARAM if param is None else param
+        self.cash = np.array(cash, dtype=np.float64)
+        self.accountid = np.broadcast_to([tl.ACCOUNTID[name] for name in np.atleast_1d(account)], self.cash.shape)
+
+        self.client = np.array(client, dtype=np.intp)
+        self.stock_id = np.array(self.table.stockid(np.asarray(stock_code)), dtype=np.intp)
+        self.lot = np.array(lot, dtype=np.float64)
+        self.price = np.array(price, dtype=np.float64)
+        self.size = len(self.client)
+        stock_class = self.table.classof(self.stock_id)
+        holder = self.accountid[self.client]
+        self.multiplier = self.param[holder, tl.MS, stock_class]
+        self.capping = self.param[holder, tl.CAP, stock_class]
+        # Collateral before capping per rupiah of price
+        self.netlot = self.lot * 100 * (1 - self.table.haircut[self.stock_id])
+        self.contribution = self.multiplier * np.minimum(self.netlot * self.price, self.capping)
+        self.collateral = np.bincount(self.client, weights=self.contribution, minlength=len(self.cash))
+
+        buy_class = self.table.classof(self.table.stockid(stock_buy))
+        self.effectivebuyrate = self.param[self.accountid, tl.EBR, buy_class]
+        self.multipliercash = self.param[self.accountid, tl.MC, buy_class]
+        self.limit = self.limits()
+
+        # Reverse index: the rows holding stock s are order[start[s]:start[s + 1]],
+        # plus extra[s] for positions opened after construction
+        self.order = np.argsort(self.stock_id, kind="stable")
+        self.start = np.concatenate([[0], np.cumsum(np.bincount(self.stock_id, minlength=len(self.table)))])
+        self.extra = {}
+
+    def limits(self, clients=slice(None)):
+        return self.effectivebuyrate[clients] * \
+            (self.multipliercash[clients] * self.cash[clients] + self.collateral[clients])
+
+    def tradinglimit(self, clients, stock_buy):
+        """Limits of clients for candidate stocks (one per client), leaving the tracked limits alone"""
+        clients = np.asarray(clients, dtype=np.intp)
+        buy_class = self.table.classof(self.table.stockid(stock_buy))
+        accountid = self.accountid[clients]
+        return self.param[accountid, tl.EBR, buy_class] * \
+            (self.param[accountid, tl.MC, buy_class] * self.cash[clients] + self.collateral[clients])
+
+    def rows(self, stock_code):
+        """Holding rows of one stock; empty for codes outside the haircut table"""
+        if isinstance(stock_code, str) and stock_code not in self.table.index:
+            return self.order[:0]
+        stock_id = self.table.stockid(stock_code)
+        rows = self.order[self.start[stock_id]:self.start[stock_id + 1]]
+        if stock_id in self.extra:
+            rows = np.concatenate([rows, self.extra[stock_id]])
+        return rows
+
+    def update(self, clients):
+        """Recompute the limits of clients; returns those that changed, with old and new limits"""
+        clients = np.unique(clients)
+        before = self.limit[clients]
+        after = self.limits(clients)
+        self.limit[clients] = after
+        changed = before != after
+        return clients[changed], before[changed], after[changed]
+
+    def revalue(self, rows):
+        contribution = self.multiplier[rows] * np.minimum(self.netlot[rows] * self.price[rows], self.capping[rows])
+        np.add.at(self.collateral, self.client[rows], contribution - self.contribution[rows])
+        self.contribution[rows] = contribution
+        return self.update(self.client[rows])
+
+    def tick(self, stock_code, price):
+        """Revalue every holding of one stock; returns the clients whose limit changed, with old and new limits"""
+        rows = self.rows(stock_code)
+        self.price[rows] = price
+        return self.revalue(rows)
+
+    def fill(self, client, stock_code, lot, price, fee=0.0):
+        """Apply an executed trade of one client: positive lot buys, negative lot sells"""
+        stock_id = self.table.stockid(stock_code)
+        rows = self.rows(stock_id)
+        row = rows[self.client[rows] == client]
+        held = self.lot[row[0]] if len(row) else 0
+        if held + lot < 0:
+            raise ValueError(f"Cannot sell {-lot} lots of {self.table.code[stock_id]} for client {client}: only {held} held")
+        row = row[0] if len(row) else self.addrow(client, stock_id)
+        self.lot[row] += lot
+        self.price[row] = price
+        self.netlot[row] = self.lot[row] * 100 * (1 - self.table.haircut[stock_id])
+        self.cash[client] -= lot * 100 * price + fee
+        return self.revalue([row])
+
+    def movecash(self, client, amount):
+        """Deposit (positive) or withdraw (negative) cash of one client"""
+        self.cash[client] += amount
+        return self.update([client])
+
+    def addrow(self, client, stock_id):
+        if self.size == len(self.client):
+            # Grow every row array geometrically so that appending stays amortized O(1)
+            for name in ("client", "stock_id", "lot", "price", "netlot", "multiplier", "capping", "contribution"):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.zeros_like(array, shape=max(len(array), 16))]))
+        row = self.size
+        self.size += 1
+        stock_class = self.table.classof(stock_id)
+        self.client[row] = client
+        self.stock_id[row] = stock_id
+        self.multiplier[row] = self.param[self.accountid[client], tl.MS, stock_class]
+        self.capping[row] = self.param[self.accountid[client], tl.CAP, stock_class]
+        self.extra.setdefault(stock_id, []).append(row)
+        return row
+
+    def run(self, feed):
+        """Apply every (stock_code, price) of feed, yielding the changes of each tick"""
+        for stock_code, price in feed:
+            clients, before, after = self.tick(stock_code, price)
+            if len(clients):
+                yield stock_code, clients, before, after
+
+def parsefeed(lines):
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        stock_code, price = line.split(",")[:2]
+        yield stock_code.strip(), float(price)
+
+def readfeed(source):
+    """Ticks from a file of "CODE,PRICE" lines, "-" for stdin, or a tcp://host:port line stream"""
+    if source == "-":
+        yield from parsefeed(sys.stdin)
+    elif source.startswith("tcp://"):
+        host, port = source[len("tcp://"):].rsplit(":", 1)
+        with socket.create_connection((host, int(port))) as conn, conn.makefile("r", encoding="utf-8") as lines:
+            yield from parsefeed(lines)
+    else:
+        with open(source, "r", encoding="utf-8") as lines:
+            yield from parsefeed(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream trading limit changes under a price feed")
+    parser.add_argument("book", help="JSON of portofolios keyed by client, in the tl.tradinglimit() format")
+    parser.add_argument("feed", help='"CODE,PRICE" lines: a file, "-" for stdin, or tcp://host:port')
+    parser.add_argument("--account", default="FREE")
+    parser.add_argument("--stock-buy", default="BBCA")
+    args = parser.parse_args()
+
+    with open(args.book, "r") as f:
+        clients, client, stock_code, lot, price, cash = tl.flattenportofolio(json.load(f))
+    stream = LimitStream(client, stock_code, lot, price, cash, account=args.account, stock_buy=args.stock_buy)
+    print("stock_code,client,before,after")
+    for tick_code, changed, before, after in stream.run(readfeed(args.feed)):
+        for index, old, new in zip(changed, before, after):
+            print(f"{tick_code},{clients[index]},{old:.0f},{new:.0f}", flush=True)
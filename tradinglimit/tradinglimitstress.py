@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import tradinglimit as tl
+
+def stockvol(vol, stock_id, table):
+    """Volatility of every stock in stock_id from a scalar or a {code: vol} mapping"""
+    if np.isscalar(vol):
+        return np.full(len(stock_id), float(vol))
+    byid = np.full(len(table), np.nan)
+    byid[table.stockid(np.array(list(vol), dtype=str))] = np.array(list(vol.values()), dtype=np.float64)
+    missing = np.isnan(byid[stock_id])
+    if missing.any():
+        raise KeyError(f"No volatility for stock code(s) {', '.join(str(code) for code in table.code[stock_id[missing]])}")
+    return byid[stock_id]
+
+def pricemoves(rng, npath, sigma, correlation):
+    """[path, stock] gross returns over the horizon under a one-factor model.
+
+    Every stock loads sqrt(correlation) on a common market factor, so any two stocks
+    have that correlation; returns are lognormal with sigma per stock and mean 1.
+    """
+    draw = rng.standard_normal((npath, len(sigma) + 1))
+    x = np.sqrt(correlation) * draw[:, :1] + np.sqrt(1 - correlation) * draw[:, 1:]
+    return np.exp(sigma * x - sigma * sigma / 2)
+
+def stress(account="FREE", stock_buy="BBCA", client=(), stock_code=(), lot=(), price=(), cash=(), exposure=None,
+        vol=0.02, correlation=0.3, horizon=1, npath=10000, seed=0, maxelements=4000000, clients=None, table=None, param=None):
+    """Monte Carlo distribution of the limits and margin shortfalls of a whole book.
+
+    Prices of the held stocks move together over horizon days (vol is daily, a scalar
+    or {code: vol}; correlation is the constant pairwise correlation); haircuts, classes
+    and cappings stay as they are. The shortfall of a client is max(exposure - limit, 0).
+    Paths are simulated in chunks of at most maxelements holdings x paths, so memory does
+    not grow with npath. The book is given as in tl.tradinglimitbatch.
+    Returns a DataFrame indexed by client (baseline limit, mean and std of the limit,
+    probability of a shortfall and expected shortfall) and a DataFrame indexed by path
+    (total limit and total shortfall of the book).
+    """
+    table = tl.gethaircuttable() if table is None else table
+    param = (tl.PARAM if param is None else param)[tl.ACCOUNTID[account]]
+    if not 0 <= correlation <= 1:
+        raise ValueError(f"correlation must be between 0 and 1, got {correlation}")
+    cash = np.asarray(cash, dtype=np.float64)
+    client = np.asarray(client, dtype=np.intp)
+    lot = np.asarray(lot, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    exposure = np.zeros(len(cash)) if exposure is None else np.broadcast_to(np.asarray(exposure, dtype=np.float64), cash.shape)
+    stock_id = table.stockid(np.asarray(stock_code))
+    stock_class = table.classof(stock_id)
+    buy_class = table.classof(np.broadcast_to(table.stockid(stock_buy), cash.shape))
+
+    # Only the held stocks are simulated; holding maps into them
+    held, holding = np.unique(stock_id, return_inverse=True)
+    sigma = stockvol(vol, held, table) * np.sqrt(horizon)
+    value = lot * 100 * price * (1 - table.haircut[stock_id])
+    multiplier = param[tl.MS, stock_class]
+    capping = param[tl.CAP, stock_class]
+    base = param[tl.MC, buy_class] * cash
+    ebr = param[tl.EBR, buy_class]
+    baseline = ebr * (base + np.bincount(client, weights=multiplier * np.minimum(value, capping), minlength=len(cash)))
+
+    nclient = len(cash)
+    rng = np.random.default_rng(seed)
+    chunk = max(1, maxelements // max(len(client), nclient, 1))
+    mean, m2, count = np.zeros(nclient), np.zeros(nclient), 0
+    short, shortfallsum = np.zeros(nclient), np.zeros(nclient)
+    total, totalshortfall = np.empty(npath), np.empty(npath)
+    for start in range(0, npath, chunk):
+        n = min(chunk, npath - start)
+        move = pricemoves(rng, n, sigma, correlation)[:, holding]
+        collateral = multiplier * np.minimum(value * move, capping)
+        key = (np.arange(n)[:, None] * nclient + client).ravel()
+        limit = ebr * (base + np.bincount(key, weights=collateral.ravel(), minlength=n * nclient).reshape(n, nclient))
+        shortfall = np.maximum(exposure - limit, 0)
+
+        # Merge the chunk's mean and sum of squared deviations into the running ones
+        chunkmean = limit.mean(axis=0)
+        diff = chunkmean - mean
+        m2 += ((limit - chunkmean) ** 2).sum(axis=0) + diff * diff * count * n / (count + n)
+        mean += diff * n / (count + n)
+        count += n
+        short += np.count_nonzero(shortfall > 0, axis=0)
+        shortfallsum += shortfall.sum(axis=0)
+        total[start:start + n] = limit.sum(axis=1)
+        totalshortfall[start:start + n] = shortfall.sum(axis=1)
+
+    index = pd.Index(range(nclient) if clients is None else clients, name="client")
+    byclient = pd.DataFrame({
+        "baseline": baseline,
+        "mean": mean,
+        "std": np.sqrt(m2 / max(count - 1, 1)),
+        "pshortfall": short / max(count, 1),
+        "expectedshortfall": shortfallsum / max(count, 1),
+    }, index=index)
+    bypath = pd.DataFrame({"limit": total, "shortfall": totalshortfall}, index=pd.RangeIndex(npath, name="path"))
+    return byclient, bypath
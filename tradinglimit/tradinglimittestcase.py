@@ -1,7 +1,14 @@
 import os
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
-
+import re
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
 import tradinglimit as tl
+from tradinglimitsolver import maxlots, checklots
+
+CASEPATH = os.path.join(tl.FOLDER, "macro_data.json")
 
 portofolios = { 
     "case1": {
@@ -148,23 +155,165 @@ portofolios = {
     },
 '''
 
-incorrect = 0
-correct = 0
+def parsenumber(value):
+    """OCR text such as "30,000,001,024" as a number; numbers pass through"""
+    if isinstance(value, (int, float)):
+        return value
+    return int(re.sub(r"[^\d-]", "", value))
+
+def loadcases(path=CASEPATH, skipanomaly=True):
+    """Inline and recorded cases as tl.tradinglimitbatch arrays, one row per (case, stock_buy)"""
+    cases = dict(portofolios)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            MASTERDATA = json.load(f)
+        for name, case in MASTERDATA.get("testcase", {}).items():
+            if skipanomaly and MASTERDATA.get("anomaly", {}).get(name):
+                continue
+            cases[name] = case
+
+    names, stock_buys, expected, rows = [], [], [], {}
+    for name, case in cases.items():
+        portofolio = {}
+        for stock_code, stock_info in case["input"].items():
+            if stock_code == "CASHT2":
+                portofolio[stock_code] = parsenumber(stock_info)
+            else:
+                portofolio[stock_code] = {"lot": parsenumber(stock_info["lot"]), "price": parsenumber(stock_info["price"])}
+        for stock_buy, output_value in case["output"].items():
+            rows[len(rows)] = portofolio
+            names.append(name)
+            stock_buys.append(stock_buy)
+            expected.append(parsenumber(output_value))
+
+    _, client, stock_code, lot, price, cash = tl.flattenportofolio(rows)
+    return {
+        "case": np.array(names, dtype=str),
+        "stock_buy": np.array(stock_buys, dtype=str),
+        "expected": np.array(expected, dtype=np.float64),
+        "client": client,
+        "stock_code": stock_code,
+        "lot": lot,
+        "price": price,
+        "cash": cash,
+    }
+
+def knowncases(cases, table):
+    """Rows of loadcases() whose stock_buy and holdings are all in the haircut table"""
+    valid = table.index.get_indexer(cases["stock_buy"]) >= 0
+    valid[cases["client"][table.index.get_indexer(cases["stock_code"]) < 0]] = False
+    return valid
+
+def regression(cases, account="FREE", tolerance=10000, table=None):
+    """Every case of loadcases() through tl.tradinglimitbatch, with status ok, fail or unknown"""
+    table = tl.gethaircuttable() if table is None else table
+    valid = knowncases(cases, table)
+    held = valid[cases["client"]]
+    stock_buy = np.where(valid, cases["stock_buy"], table.code[0])
+    predicted = tl.tradinglimitbatch(account, stock_buy, cases["client"][held], cases["stock_code"][held],
+        cases["lot"][held], cases["price"][held], cases["cash"], table=table)
+    predicted[~valid] = np.nan
+    delta = predicted - cases["expected"]
+    status = np.where(~valid, "unknown", np.where(np.abs(delta) > tolerance, "fail", "ok"))
+    return pd.DataFrame({
+        "case": cases["case"],
+        "stock_buy": cases["stock_buy"],
+        "predicted": predicted,
+        "expected": cases["expected"],
+        "delta": delta,
+        "status": status,
+    })
+
+def portofolioof(cases, rows):
+    """The portofolio dicts of the given rows of loadcases(), in the tl.tradinglimit() format"""
+    order = np.argsort(cases["client"], kind="stable")
+    start = np.searchsorted(cases["client"][order], np.arange(len(cases["cash"]) + 1))
+    for row in rows:
+        portofolio = {"CASHT2": cases["cash"][row]}
+        for holding in order[start[row]:start[row + 1]]:
+            portofolio[str(cases["stock_code"][holding])] = {"lot": cases["lot"][holding], "price": cases["price"][holding]}
+        yield row, portofolio
+
+def reference(cases, account="FREE", rows=None):
+    """tl.tradinglimit() of the given rows of loadcases(), one portofolio dict at a time"""
+    rows = np.arange(len(cases["cash"])) if rows is None else rows
+    limit = np.full(len(cases["cash"]), np.nan)
+    for row, portofolio in portofolioof(cases, rows):
+        limit[row] = tl.tradinglimit(account=account, stock_buy=str(cases["stock_buy"][row]), portofolio=portofolio)
+    return limit
+
+def exact(cases, account="FREE", table=None):
+    """tl.tradinglimitexact() of every row of loadcases(), NaN where regression() reports unknown"""
+    table = tl.gethaircuttable() if table is None else table
+    valid = knowncases(cases, table)
+    held = valid[cases["client"]]
+    stock_buy = np.where(valid, cases["stock_buy"], table.code[0])
+    limit = tl.tradinglimitexact(account, stock_buy, cases["client"][held], cases["stock_code"][held],
+        cases["lot"][held], cases["price"][held], cases["cash"], table=table).astype(np.float64)
+    limit[~valid] = np.nan
+    return limit
+
+def solvercheck(cases, account="FREE", trials=200, seed=0, table=None):
+    """Random (case, stock, price, feerate) draws where maxlots() plus one lot fits or maxlots() does not"""
+    table = tl.gethaircuttable() if table is None else table
+    rng = np.random.default_rng(seed)
+    rows = np.flatnonzero(knowncases(cases, table))
+    draws = []
+    for row, portofolio in portofolioof(cases, rng.choice(rows, trials) if len(rows) else []):
+        stock_code = str(table.code[rng.integers(len(table))])
+        price = float(rng.integers(50, 20000))
+        feerate = float(rng.choice([0.0, 0.0015]))
+        lots = int(maxlots(account, portofolio, {stock_code: price}, feerate, table=table).iloc[0])
+        fits = checklots(account, portofolio, stock_code, lots, price, feerate)
+        over = checklots(account, portofolio, stock_code, lots + 1, price, feerate)
+        if not fits or over:
+            draws.append((cases["case"][row], stock_code, price, feerate, lots, fits, over))
+    return pd.DataFrame(draws, columns=["case", "stock_code", "price", "feerate", "maxlots", "fits", "oneover"])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regression of the trading limit against recorded cases")
+    parser.add_argument("--account", default="FREE")
+    parser.add_argument("--data", default=CASEPATH)
+    parser.add_argument("--tolerance", type=float, default=10000)
+    parser.add_argument("--all", action="store_true", help="also run cases flagged as anomaly")
+    parser.add_argument("--trials", type=int, default=200, help="random maxlots draws checked against checklots")
+    args = parser.parse_args()
 
-for casenumber, portofolio in portofolios.items():
-    for stock_buy, output_value in portofolio["output"].items():
-        predict = tl.tradinglimit(account = "FREE", stock_buy = stock_buy, portofolio = portofolio["input"])
-        delta = predict - portofolio["output"][stock_buy]
-        print("input: " + casenumber + " on " + stock_buy + \
-            "\n output: " + str(predict) + \
-            "\n output: " + str(portofolio["output"][stock_buy]) + \
-            "\n delta : " + str(predict - portofolio["output"][stock_buy]))
-        if abs(delta) > 10000:
-            print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-            incorrect += 1
-        else:
-            print("ok")
-            correct += 1
+    start = time.perf_counter()
+    cases = loadcases(args.data, skipanomaly=not args.all)
+    loaded = time.perf_counter()
+    report = regression(cases, args.account, args.tolerance)
+    end = time.perf_counter()
+    # The scalar engine stays the reference for the batch one
+    known = np.flatnonzero(report["status"] != "unknown")
+    report["reference"] = reference(cases, args.account, known)
+    mismatch = report.loc[known][~np.isclose(report["predicted"][known], report["reference"][known], rtol=1e-9, atol=1)]
+    # The fixed-point engine rounds to the rupiah, the float one does not
+    report["exact"] = exact(cases, args.account)
+    inexact = report.loc[known][np.abs(report["exact"][known] - report["predicted"][known]) > 1]
+    unsolved = solvercheck(cases, args.account, args.trials)
 
-print("\n TOTAL X:" + str(incorrect) + \
-    "\n TOTAL V:" + str(correct))
+    delta = report["delta"].dropna()
+    print(f"{len(report)} cases, loaded in {loaded - start:.3f} s, evaluated in {end - loaded:.3f} s")
+    if len(delta):
+        quantile = np.percentile(delta, [0, 5, 50, 95, 100])
+        print("delta  " + "  ".join(f"{name} {value:,.0f}" for name, value in zip(("min", "p5", "p50", "p95", "max"), quantile)))
+        print(f"mean |delta| {np.mean(np.abs(delta)):,.0f}")
+    failed = report[report["status"] != "ok"]
+    if len(failed):
+        print(failed.to_string(index=False))
+    if len(mismatch):
+        print("tradinglimitbatch differs from tradinglimit():")
+        print(mismatch[["case", "stock_buy", "predicted", "reference"]].to_string(index=False))
+    if len(inexact):
+        print("tradinglimitexact differs from tradinglimitbatch:")
+        print(inexact[["case", "stock_buy", "predicted", "exact"]].to_string(index=False))
+    if len(unsolved):
+        print("maxlots differs from checklots:")
+        print(unsolved.to_string(index=False))
+    print("\n TOTAL X:" + str(np.sum(report["status"] == "fail")) + \
+        "\n TOTAL V:" + str(np.sum(report["status"] == "ok")) + \
+        "\n UNKNOWN:" + str(np.sum(report["status"] == "unknown")) + \
+        "\n MISMATCH:" + str(len(mismatch)) + \
+        "\n EXACT:" + str(len(inexact)) + \
+        "\n SOLVER:" + str(len(unsolved)))